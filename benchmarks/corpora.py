@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Generated documents for the benchmarks, one corpus for each kind of defect the
+# parser repairs, plus valid JSON and log text with JSON objects in it.
+#
+# Each corpus is a function taking a size in bytes and returning a document of
+# about that size, built by repeating a record with the defect in it.
+
+import json
+
+
+def build(opening, record, separator, closing, size):
+    records = []
+    length = len(opening) + len(closing)
+    i = 0
+    while length < size or not records:
+        text = record(i)
+        records.append(text)
+        length += len(text) + len(separator)
+        i += 1
+    return opening + separator.join(records) + closing
+
+
+def unquoted_keys(size):
+    return build('{ records: [', lambda i: '{ id: %d, name: "item %d", active: true }' % (i, i), ', ', '] }', size)
+
+
+def single_quotes(size):
+    return build("{ 'records': [", lambda i: "{ 'id': %d, 'name': 'item %d', 'note': 'say \"hi\"' }" % (i, i), ', ', '] }', size)
+
+
+def backticks(size):
+    return build('{ `records`: [', lambda i: '{ `id`: %d, `name`: `item %d`, `note`: `it\'s here` }' % (i, i), ', ', '] }', size)
+
+
+def smart_quotes(size):
+    return build('{ “records”: [', lambda i: '{ “id”: %d, “name”: “item %d” }' % (i, i), ', ', '] }', size)
+
+
+def concatenation(size):
+    return build('{ "records": [', lambda i: '{ "id": %d, "name": "item " + "%d" + \'!\' }' % (i, i), ', ', '] }', size)
+
+
+def trailing_commas(size):
+    return build('{ "records": [', lambda i: '{ "id": %d, "tags": ["a", "b",], }' % i, ', ', ',] }', size)
+
+
+def missing_commas(size):
+    return build('{ "records": [', lambda i: '{ "id": %d "name": "item %d" "tags": ["a" "b"] }' % (i, i), ' ', '] }', size)
+
+
+def references(size):
+    return build('{ "records": [', lambda i: '{ "id": %d, "child": <ref *1> { "parent": [Circular *1] } }' % i, ', ', '] }', size)
+
+
+def python_literals(size):
+    return build('{ "records": [', lambda i: '{ "id": %d, "ok": True, "done": False, "parent": None }' % i, ', ', '] }', size)
+
+
+def kibana_escaped(size):
+    return build('{\\"records\\": [', lambda i: '{\\"id\\": %d, \\"name\\": \\"item %d\\"}' % (i, i), ', ', ']}', size)
+
+
+def stringified(size):
+    return json.dumps(unquoted_keys(size))
+
+
+def valid_json(size):
+    return build('{ "records": [', lambda i: '{ "id": %d, "name": "item %d", "active": true }' % (i, i), ', ', '] }', size)
+
+
+def log_text(size):
+    return build(
+        '',
+        lambda i: "2023-06-01 12:00:%02d INFO request handled { path: '/api/%d', status: 200, ms: %d } for {user}"
+        % (i % 60, i, i % 97),
+        '\n',
+        '',
+        size,
+    )
+
+
+# The corpora that are single broken documents for repair_json
+DOCUMENTS = {
+    'unquoted_keys': unquoted_keys,
+    'single_quotes': single_quotes,
+    'backticks': backticks,
+    'smart_quotes': smart_quotes,
+    'concatenation': concatenation,
+    'trailing_commas': trailing_commas,
+    'missing_commas': missing_commas,
+    'references': references,
+    'python_literals': python_literals,
+    'kibana_escaped': kibana_escaped,
+    'stringified': stringified,
+    'valid_json': valid_json,
+}
+
+# The corpora of text with JSON in it for finding JSON
+TEXTS = {
+    'log_text': log_text,
+}
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# Measures how repair_many scales with the number of worker processes, on a batch
+# of small broken JSON objects like the ones a language model produces.
+#
+#   python benchmarks/parallel.py [number of inputs] [largest number of workers]
+
+import os
+import sys
+import time
+from fix_busted_json import repair_many
+
+
+def make_inputs(count):
+    return [
+        "{ location: 'London %d', 'title': `developer`, "
+        "remote: True, salary: None, skills: ['python', \"sql\",], notes: 'Lead' + ' role', }" % i
+        for i in range(count)
+    ]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    largest = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    inputs = make_inputs(count)
+    counts = [1]
+    while counts[-1] * 2 < largest:
+        counts.append(counts[-1] * 2)
+    if largest > 1:
+        counts.append(largest)
+    baseline = None
+    for workers in counts:
+        start = time.perf_counter()
+        for _ in repair_many(inputs, workers=workers):
+            pass
+        seconds = time.perf_counter() - start
+        baseline = baseline or seconds
+        print(f"{workers:3d} workers {seconds:8.3f} s {count / seconds:10.0f} items/s {baseline / seconds:6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
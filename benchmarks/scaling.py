@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Times repair_json on documents of doubling size. With linear output building the
+# time per MB stays flat as the documents grow.
+#
+#   python benchmarks/scaling.py [largest size in MB]
+
+import sys
+import time
+from fix_busted_json import repair_json
+
+
+def make_document(size):
+    records = []
+    length = 0
+    i = 0
+    while length < size:
+        record = (
+            "{ id: %d, name: 'item' + ' %d', tags: ['a', 'b', 'c',], "
+            "note: `%s`, nested: { ok: True, value: None, }, }" % (i, i, 'x' * (i % 200))
+        )
+        records.append(record)
+        length += len(record) + 2
+        i += 1
+    return "{ records: [" + ', '.join(records) + ",], description: '" + 'y' * size + "' }"
+
+
+def time_repair(document):
+    start = time.perf_counter()
+    repair_json(document)
+    return time.perf_counter() - start
+
+
+def main():
+    largest = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    sizes = []
+    size = largest
+    while size >= largest / 16:
+        sizes.insert(0, size)
+        size /= 2
+
+    print(f"{'size MB':>8} {'seconds':>9} {'MB/s':>7} {'s per MB':>9}")
+    per_mb = []
+    for size in sizes:
+        document = make_document(int(size * 1024 * 1024 / 2))
+        megabytes = len(document) / 1024 / 1024
+        seconds = time_repair(document)
+        per_mb.append(seconds / megabytes)
+        print(f"{megabytes:8.2f} {seconds:9.3f} {megabytes / seconds:7.2f} {seconds / megabytes:9.3f}")
+
+    print(f"\nseconds per MB, largest vs smallest document: {per_mb[-1] / per_mb[0]:.2f}x (1.00x is linear)")
+
+
+if __name__ == '__main__':
+    main()
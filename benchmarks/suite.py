@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# Times repair_json on a corpus for each kind of defect, and to_array_of_plain_strings_or_json
+# and the selector functions on log text, at each of the given sizes. Reports throughput,
+# latency percentiles and peak memory, and compares them with the results of an earlier run.
+#
+#   python benchmarks/suite.py --sizes 1k,64k,1m --save before.json
+#   python benchmarks/suite.py --sizes 1k,64k,1m --compare before.json
+
+import argparse
+import json
+import platform
+import re
+import sys
+import time
+import tracemalloc
+
+import corpora
+import fix_busted_json
+
+SIZES = {'k': 1024, 'm': 1024 * 1024}
+
+# The number of times each case is run is enough to repair about this much text,
+# so small documents are run many times and the largest ones once
+BYTES_PER_CASE = 8 * 1024 * 1024
+MAX_RUNS = 500
+
+SELECTORS = {
+    'to_array': fix_busted_json.to_array_of_plain_strings_or_json,
+    'first_json': fix_busted_json.first_json,
+    'last_json': fix_busted_json.last_json,
+    'largest_json': fix_busted_json.largest_json,
+    'json_matching': lambda text: fix_busted_json.json_matching(text, re.compile('/api/12345\'')),
+}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1] in SIZES:
+        return int(float(text[:-1]) * SIZES[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for suffix, multiple in (('m', SIZES['m']), ('k', SIZES['k'])):
+        if size >= multiple and size % multiple == 0:
+            return f'{size // multiple}{suffix}'
+    return str(size)
+
+
+def percentile(sorted_times, fraction):
+    return sorted_times[min(len(sorted_times) - 1, int(fraction * len(sorted_times)))]
+
+
+def measure(function, text, memory):
+    runs = max(1, min(MAX_RUNS, BYTES_PER_CASE // len(text)))
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(text)
+        times.append(time.perf_counter() - start)
+    total = sum(times)
+    times.sort()
+    result = {
+        'runs': runs,
+        'mb_per_second': len(text) * runs / total / 1024 / 1024,
+        'docs_per_second': runs / total,
+        'p50_ms': percentile(times, 0.5) * 1000,
+        'p90_ms': percentile(times, 0.9) * 1000,
+        'p99_ms': percentile(times, 0.99) * 1000,
+    }
+    if memory:
+        tracemalloc.start()
+        function(text)
+        result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return result
+
+
+def cases(sizes, names):
+    for size in sizes:
+        for corpus, make in corpora.DOCUMENTS.items():
+            if not names or corpus in names:
+                yield 'repair_json', corpus, size, make, fix_busted_json.repair_json
+        for corpus, make in corpora.TEXTS.items():
+            if not names or corpus in names:
+                for operation, function in SELECTORS.items():
+                    yield operation, corpus, size, make, function
+
+
+def compare(result, previous, threshold):
+    if previous is None:
+        return '', False
+    change = (result['mb_per_second'] / previous['mb_per_second'] - 1) * 100
+    slower = change < -threshold
+    return f' {change:+7.1f}%' + (' slower' if slower else ''), slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks fix_busted_json on generated corpora.')
+    parser.add_argument('--sizes', default='1k,64k,1m', help='document sizes, e.g. 1k,1m,100m (default: 1k,64k,1m)')
+    parser.add_argument('--corpus', action='append', help='only run this corpus, can be given more than once')
+    parser.add_argument('--save', help='save the results to this file')
+    parser.add_argument('--compare', help='compare with the results saved in this file')
+    parser.add_argument('--threshold', type=float, default=10, help='percent slower that counts as a regression (default: 10)')
+    parser.add_argument('--no-memory', action='store_true', help='skip measuring peak memory, which takes an extra run')
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)['results']
+
+    results = {}
+    regressions = 0
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    for operation, corpus, size, make, function in cases(sizes, args.corpus):
+        text = make(size)
+        result = measure(function, text, not args.no_memory)
+        key = f'{operation} {corpus} {format_size(size)}'
+        results[key] = result
+        change, slower = compare(result, previous.get(key), args.threshold)
+        regressions += slower
+        peak = f" {result['peak_mb']:8.2f} MB peak" if 'peak_mb' in result else ''
+        print(
+            f"{operation:<14} {corpus:<16} {format_size(size):>5} "
+            f"{result['mb_per_second']:8.2f} MB/s {result['docs_per_second']:10.1f} docs/s "
+            f"p50 {result['p50_ms']:9.3f} ms p90 {result['p90_ms']:9.3f} ms p99 {result['p99_ms']:9.3f} ms"
+            f"{peak}{change}",
+            flush=True,
+        )
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump({'python': platform.python_version(), 'results': results}, file, indent=2)
+    if regressions:
+        print(f'{regressions} slower than {args.threshold}% compared with {args.compare}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
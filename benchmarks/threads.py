@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# Measures how repair_json scales with the number of threads calling it at once,
+# on a batch of small broken JSON objects like the ones a language model produces.
+# With the GIL the threads take turns, so expect about 1x. On a free-threaded build
+# (python3.13t) the repairs share nothing, so they should scale with the cores.
+#
+#   python benchmarks/threads.py [number of inputs] [largest number of threads]
+
+import concurrent.futures
+import os
+import sys
+import time
+from fix_busted_json import repair_json
+
+
+def make_inputs(count):
+    return [
+        "{ location: 'London %d', 'title': `developer`, "
+        "remote: True, salary: None, skills: ['python', \"sql\",], notes: 'Lead' + ' role', }" % i
+        for i in range(count)
+    ]
+
+
+def repair_all(inputs):
+    for text in inputs:
+        repair_json(text)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    largest = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    inputs = make_inputs(count)
+    gil = sys._is_gil_enabled() if hasattr(sys, '_is_gil_enabled') else True
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    counts = [1]
+    while counts[-1] * 2 < largest:
+        counts.append(counts[-1] * 2)
+    if largest > 1:
+        counts.append(largest)
+    baseline = None
+    for threads in counts:
+        # Each thread repairs its own share of the inputs
+        shares = [inputs[i::threads] for i in range(threads)]
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            start = time.perf_counter()
+            list(executor.map(repair_all, shares))
+            seconds = time.perf_counter() - start
+        baseline = baseline or seconds
+        print(f"{threads:3d} threads {seconds:8.3f} s {count / seconds:10.0f} items/s {baseline / seconds:6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Measures repair throughput in MB/s on broken documents, so the repair engine
+# (not the valid JSON fast path) is what gets timed.
+#
+#   python benchmarks/throughput.py [size in MB]
+
+import sys
+import time
+from fix_busted_json import repair_json, to_array_of_plain_strings_or_json
+
+
+def make_document(size):
+    records = []
+    length = 0
+    i = 0
+    while length < size:
+        record = (
+            "{\n    id: %d,\n    'name': 'item %d',\n    `description`: `%s`,\n"
+            "    score: -%d.5e3,\n    tags: ['a', \"b\", 'c',],\n    valid: True,\n    parent: None\n}"
+            % (i, i, 'lorem ipsum dolor sit amet ' * (i % 8), i)
+        )
+        records.append(record)
+        length += len(record) + 2
+        i += 1
+    return '{ records: [' + ',\n'.join(records) + '] }'
+
+
+def make_log(size):
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        line = "2023-06-01 12:00:%02d INFO request handled { path: '/api/%d', status: 200, ms: %d }" % (i % 60, i, i % 97)
+        lines.append(line)
+        length += len(line) + 1
+        i += 1
+    return '\n'.join(lines)
+
+
+def make_log_with_stray_braces(size):
+    lines = []
+    length = 0
+    i = 0
+    while length < size:
+        line = "template { name: {{ user.name }} { unclosed: [ 1, { nested: %d ok { result: 'done', id: %d }" % (i, i)
+        lines.append(line)
+        length += len(line) + 1
+        i += 1
+    return '\n'.join(lines)
+
+
+def measure(name, function, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    megabytes = len(text) / 1024 / 1024
+    print(f"{name:<36} {megabytes:7.2f} MB {best:8.3f} s {megabytes / best:8.2f} MB/s")
+
+
+def main():
+    size = int(float(sys.argv[1] if len(sys.argv) > 1 else 1) * 1024 * 1024)
+    measure('repair_json', repair_json, make_document(size))
+    measure('to_array_of_plain_strings_or_json', to_array_of_plain_strings_or_json, make_log(size))
+    measure('... with stray braces', to_array_of_plain_strings_or_json, make_log_with_stray_braces(size))
+
+
+if __name__ == '__main__':
+    main()
@@ -16,8 +16,11 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],                                      # Information to filter the project on PyPi website
-    python_requires='>=3.6',                # Minimum version requirement of the package
+    python_requires='>=3.7',                # Minimum version requirement of the package
     py_modules=["fix_busted_json"],         # Name of the python package
     package_dir={'':'src'},                 # Directory of the source code of the package
+    entry_points={                          # Command-line tool
+        'console_scripts': ['fix-busted-json=fix_busted_json:main'],
+    },
     install_requires=[]                     # Install other dependencies if any
 )
\ No newline at end of file
@@ -1,13 +1,266 @@
 #!/usr/bin/env python3
 
+import argparse
+import array
+import codecs
+import collections
+import copy
+import functools
+import hashlib
+import inspect
+import io
+import itertools
 import json
+import mmap
+import os
+import random
 import re
+import sys
+import threading
+import time
+import zlib
+
+# asyncio and concurrent.futures are imported where they are used, as importing them
+# takes longer than everything else, which matters for the command-line tool
+
+
+JSON_STRING_REGEX = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")')
+
+# The scanner consumes whole runs of characters with one match, and classifies
+# single characters by looking them up in these tables
+WHITESPACE_REGEX = re.compile(r'\s*')
+REFERENCE_NUMBER_REGEX = re.compile(r'[0-9]*')
+NUMBER_REGEX = re.compile(r'[\-\+eE0-9.]*')
+CIRCULAR_REGEX = re.compile(r'[Circular *\d]*')
+PLAIN_STRING_REGEX = re.compile(r'[^\\\n"\'`”]*')
+PLAIN_UNQUOTED_KEY_REGEX = re.compile(r'[^: \\"\'`“]*')
+# A step of a path like $.a[0]['b c']: a .name, an [index] or a quoted ['name']
+JSON_PATH_REGEX = re.compile(r"""\.([^.\[\]]+)|\[(\d+)\]|\['((?:[^'\\]|\\.)*)'\]|\["((?:[^"\\]|\\.)*)"\]""")
+# What is between two tokens, less the JSON whitespace either side of it
+GAP_REGEX = re.compile(r'[ \t\n\r]*(.*?)[ \t\n\r]*\Z', re.DOTALL)
+
+QUOTES = {"'": "'", '"': '"', '`': '`', '“': '”'}
+NUMBER_CHARS = frozenset('-+eE0123456789.')
+NUMBER_START_CHARS = frozenset('-0123456789')
+JSON_SPECIAL_CHARACTERS = frozenset('{}[]:,')
+
+# How much of the end of the text last_json looks at first, doubled until it is enough
+LAST_JSON_WINDOW = 65536
+
+# How much of a byte buffer is decoded from an open brace to parse the object there,
+# doubled until the parse ends more than BUFFER_LOOKAHEAD characters from the end of it
+# without having read past the end of it
+BUFFER_WINDOW = 512
+BUFFER_LOOKAHEAD = 16
+
+# How many levels of JSON in string values, JSON in those and so on, are expanded or logged
+EMBEDDED_JSON_DEPTH = 8
+
+# Checking valid JSON a slice at a time, see normalize_valid_json_in_slices. A slice
+# ends after the last string that ends in it, and before any number or keyword.
+SLICE_END_REGEX = re.compile(r'[^"]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"]*)*', re.DOTALL)
+SLICE_SCALAR_CHARS = '-+.0123456789eEtruefalsn'
+# Each string becomes \x01 and each other value \x02, which valid JSON cannot have
+# anywhere, so only the brackets, colons and commas between them are left
+VALID_STRING_REGEX = re.compile(r'"[^"\\\x00-\x1f]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*"')
+VALID_SCALAR_REGEX = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null')
+VALID_WHITESPACE_REGEX = re.compile(r'[ \t\n\r]+')
+NOT_SKELETON_REGEX = re.compile(r'[^{}\[\]:,\x01\x02]')
+# A complete object or array becomes a value, and the items of an open one that are
+# complete are dropped but for one, so only the open objects and arrays are carried
+SKELETON_CONTAINER_REGEX = re.compile(r'\{(?:\x01:[\x01\x02](?:,\x01:[\x01\x02])*)?\}|\[(?:[\x01\x02](?:,[\x01\x02])*)?\]')
+SKELETON_MEMBERS_REGEX = re.compile(r'\{(?:\x01:[\x01\x02],){2,}')
+SKELETON_ITEMS_REGEX = re.compile(r'\[(?:[\x01\x02],){2,}')
+# What is carried can only become valid JSON if it is open objects and arrays, each
+# waiting for a value that is the next of them, but for the last
+SKELETON_PREFIX_REGEX = re.compile(
+    r'(?:\{(?:\x01:[\x01\x02],)?\x01:|\[(?:[\x01\x02],)?)*'
+    r'(?:\{(?:\x01:[\x01\x02],)?(?:\x01(?::[\x01\x02]?)?)?|\[(?:[\x01\x02],)?[\x01\x02]?)?'
+)
+# json fails on JSON nested too deep for its recursion, and on integers with too many
+# digits for int, and repair_json repairs the text then, so past these json has to say
+SLICE_MAX_DEPTH = 100
+LONG_INTEGER_REGEX = re.compile(r'[0-9]{640}')
+# The slice size for chunks from an async iterator when no yield_every is given
+ASYNC_SLICE = 65536
 
 
 class JsonFixError(Exception):
     pass
 
 
+class JsonLimitError(JsonFixError):
+    pass
+
+class JsonDepthLimitError(JsonLimitError):
+    pass
+
+class JsonInputLimitError(JsonLimitError):
+    pass
+
+class JsonOutputLimitError(JsonLimitError):
+    pass
+
+class JsonAttemptLimitError(JsonLimitError):
+    pass
+
+class JsonStepLimitError(JsonLimitError):
+    pass
+
+class JsonTimeLimitError(JsonLimitError):
+    pass
+
+
+class JsonLimits(collections.namedtuple('JsonLimits', 'max_depth max_input_length max_output_length max_attempts max_steps max_seconds', defaults=(None,) * 6)):
+    """Limits on the work repairing one input can take, for input that cannot be trusted.
+
+    max_depth: how deeply objects and arrays can be nested
+    max_input_length: the length of the input, in bytes for byte buffers
+    max_output_length: the length of each repaired JSON text
+    max_attempts: how many open braces can fail to parse when looking for objects in text
+    max_steps: how many values, keys and closing brackets the parser can eat in all
+    max_seconds: how long the parser can take, from when it was created
+
+    None is no limit. Going past a limit raises its own subclass of JsonLimitError
+    as soon as it happens.
+    """
+    __slots__ = ()
+
+
+class RepairCache:
+    """A least recently used cache of results, for inputs that are seen again and again.
+
+    Entries are keyed by the function, its options and a digest of the input, so the
+    inputs themselves are not kept. The oldest entries are dropped once there are more
+    than max_entries of them or their results take more than max_bytes.
+    """
+
+    def __init__(self, max_entries=4096, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def call(self, function, arguments):
+        # The first of the bound arguments of the call is the input, the rest are options
+        input, *options = arguments.arguments.values()
+        key = (function.__name__, self.options_key(options), self.digest(input))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if entry is None:
+            try:
+                entry = (function(*arguments.args, **arguments.kwargs), None)
+            except JsonLimitError:
+                # Not cached, as whether a limit is hit can depend on more than the input
+                raise
+            except Exception as e:
+                entry = (None, e)
+            self.add(key, entry)
+        return self.result(entry)
+
+    def add(self, key, entry):
+        size = sys.getsizeof(entry[0]) + sys.getsizeof(key[2])
+        if isinstance(entry[0], list):
+            size += sum(sys.getsizeof(item) for item in entry[0])
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = entry + (size,)
+            self.bytes += size
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                self.bytes -= self.entries.popitem(last=False)[1][2]
+
+    def result(self, entry):
+        value, error = entry[:2]
+        if error is not None:
+            # The error itself is raised again, without the traceback of the call before
+            raise error.with_traceback(None)
+        if isinstance(value, list):
+            return list(value)
+        return value
+
+    def options_key(self, options):
+        return tuple((option.pattern, option.flags) if hasattr(option, 'pattern') else option for option in options)
+
+    def digest(self, input):
+        if isinstance(input, str):
+            input = input.encode('utf-8', 'surrogatepass')
+        return hashlib.blake2b(input, digest_size=16).digest()
+
+
+# Set by enable_cache, no caching unless it is. Like repair_tracing it is only ever
+# replaced as a whole and read once per call, so calls on other threads see the old
+# setting or the new one, never a mix. Repairing itself changes no module state.
+repair_cache = None
+
+def enable_cache(max_entries=4096, max_bytes=64 * 1024 * 1024):
+    global repair_cache
+    repair_cache = RepairCache(max_entries, max_bytes)
+    return repair_cache
+
+def disable_cache():
+    global repair_cache
+    repair_cache = None
+
+def cached(function):
+    # Only str and bytes are cached, as the contents of other buffers can change.
+    # Arguments are bound to the signature, so a call with them given by name has
+    # the same key as a call with them given by position. While tracing is on the
+    # cache is not used, so that every call is repaired and can be traced.
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def cached_function(*args, **kwargs):
+        cache = repair_cache
+        if cache is None or repair_tracing is not None:
+            return function(*args, **kwargs)
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        if not isinstance(next(iter(arguments.arguments.values())), (str, bytes)):
+            return function(*args, **kwargs)
+        return cache.call(function, arguments)
+    return cached_function
+
+
+# Set by enable_tracing, no tracing unless it is
+repair_tracing = None
+
+def enable_tracing(tracer, sample_rate=1.0):
+    global repair_tracing
+    repair_tracing = (tracer, sample_rate)
+
+def disable_tracing():
+    global repair_tracing
+    repair_tracing = None
+
+def new_parser(input, limits=None, unstringify=True):
+    # Tracing is done by a subclass of JsonParser, so when it is off the parser
+    # has no tracing checks at all
+    tracing = repair_tracing
+    if tracing is None:
+        return JsonParser(input, limits, unstringify)
+    tracer, sample_rate = tracing
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return JsonParser(input, limits, unstringify)
+    return TracingJsonParser(input, tracer, limits, unstringify)
+
+
 def log(obj):
     if isinstance(obj, (int, float)):
         print(obj)
@@ -19,23 +272,104 @@ def log(obj):
     else:
         log_jsons(obj)
 
-def log_jsons(text):
-    array = to_array_of_plain_strings_or_json(text)
+def log_jsons(text, file=None, max_depth=EMBEDDED_JSON_DEPTH):
+    log_plain_strings_or_json(to_array_of_plain_strings_or_json(text), file, max_depth)
+
+def log_plain_strings_or_json(array, file=None, max_depth=EMBEDDED_JSON_DEPTH):
+    # The log is built up in one list and written in one go, not printed line by line
+    output = []
+    write_plain_strings_or_json(array, output, max_depth)
+    (sys.stdout if file is None else file).write(''.join(output))
+
+def write_plain_strings_or_json(array, output, max_depth):
     for item in array:
-        log_pretty(item)
-        if is_json(item):
-            log_jsons_in_json(item)
-    print()
+        try:
+            obj = json.loads(item)
+            output.append(json.dumps(obj, indent=2) + '\n')
+        except Exception:
+            output.append(f'{item}\n')
+            continue
+        if obj and isinstance(obj, dict) and max_depth > 0:
+            write_embedded_jsons(obj, output, max_depth)
+    output.append('\n')
+
+def write_embedded_jsons(obj, output, max_depth):
+    # Walks the objects nested in obj, logging the JSON found in any of their
+    # string values, which is itself logged up to max_depth levels down
+    stack = [iter(obj.items())]
+    while stack:
+        for key, value in stack[-1]:
+            if value and isinstance(value, dict):
+                stack.append(iter(value.items()))
+                break
+            parse_json = embedded_json_parser(value)
+            if parse_json is None:
+                continue
+            matches = list(parse_json.iter_json_matches())
+            if matches and matches[0].start == parse_json.inspected.find('{'):
+                output.append(f'\nFOUND JSON found in key {key} --->\n')
+                write_plain_strings_or_json(parse_json.iter_plain_strings_or_json(matches), output, max_depth - 1)
+        else:
+            stack.pop()
+
+def embedded_json_parser(value):
+    # A string value holds JSON when, like for can_parse_json, it starts with an object
+    if not isinstance(value, str) or '{' not in value:
+        return None
+    parse_json = new_parser(value)
+    return parse_json if parse_json.is_object() else None
+
+def expand_embedded_json(obj_or_text, max_depth=EMBEDDED_JSON_DEPTH):
+    # Replaces string values that hold JSON objects with the repaired objects, in
+    # one walk that goes on into the objects found, up to max_depth levels down.
+    # Containers are copied as they are walked, so obj_or_text itself is not changed
+    if isinstance(obj_or_text, (str, bytes, bytearray, memoryview, mmap.mmap)):
+        obj_or_text = repair_to_object(obj_or_text)
+    root = [None]
+    stack = [(iter([(0, obj_or_text)]), root, 0)]
+    while stack:
+        items, target, depth = stack[-1]
+        for key, item in items:
+            if depth < max_depth:
+                parse_json = embedded_json_parser(item)
+                if parse_json is not None:
+                    try:
+                        item = parse_json.repair_value()
+                    except Exception:
+                        pass
+                    else:
+                        target[key] = expanded = {}
+                        stack.append((iter(item.items()), expanded, depth + 1))
+                        break
+            if isinstance(item, dict):
+                target[key] = expanded = {}
+                stack.append((iter(item.items()), expanded, depth))
+                break
+            if isinstance(item, list):
+                target[key] = expanded = [None] * len(item)
+                stack.append((iter(enumerate(item)), expanded, depth))
+                break
+            target[key] = item
+        else:
+            stack.pop()
+    return root[0]
+
+def reject_json_constant(name):
+    # json accepts NaN, Infinity and -Infinity, which are not JSON, so text with them
+    # is left for the repair engine rather than being taken as valid JSON
+    raise ValueError(f'{name} is not valid JSON')
+
+# Decodes valid JSON, such as the valid items of arrays, much faster than the repair engine would
+JSON_DECODER = json.JSONDecoder(parse_constant=reject_json_constant)
 
-def log_jsons_in_json(item):
-    obj = json.loads(item)
+def first_value_object(pairs):
+    obj = {}
+    for key, value in pairs:
+        obj.setdefault(key, value)
+    return obj
 
-    for key in obj:
-        if obj[key] and isinstance(obj[key], dict):
-            log_jsons_in_json(json.dumps(obj[key]))
-        elif can_parse_json(obj[key]):
-            print(f"\nFOUND JSON found in key {key} --->")
-            log_jsons(obj[key])
+# Decodes valid JSON for extract_paths, which uses the first value of a key that appears twice
+FIRST_VALUE_JSON_DECODER = json.JSONDecoder(object_pairs_hook=first_value_object, parse_constant=reject_json_constant)
 
 def is_json(text):
     try:
@@ -58,151 +392,1499 @@ def log_pretty(obj):
     except Exception:
         print(obj)
 
-def repair_json(input):
-    parse_json = JsonParser(input)
+@cached
+def repair_json(input, limits=None):
+    parse_json = new_parser(input, limits)
     return parse_json.repair_json()
 
-def to_array_of_plain_strings_or_json(input):
-    parse_json = JsonParser(input)
+def repair_to_object(input, limits=None):
+    parse_json = new_parser(input, limits)
+    return parse_json.repair_value()
+
+def repair_edits(input, limits=None):
+    parse_json = new_parser(input, limits)
+    return parse_json.repair_edits()
+
+def repair_events(input, handler, limits=None):
+    parse_json = new_parser(input, limits)
+    parse_json.repair_events(handler)
+
+def extract_paths(input, paths, limits=None):
+    parse_json = new_parser(input, limits)
+    return parse_json.extract_paths(paths)
+
+def apply_json_edits(source, edits):
+    output = io.StringIO() if isinstance(source, str) else io.BytesIO()
+    write_json_edits(source, edits, output)
+    return output.getvalue()
+
+def write_json_edits(source, edits, file):
+    # Only the edits are copied, the unchanged text in between is written straight
+    # from the source, which can be bytes, a memoryview or an mmap
+    if isinstance(source, str):
+        file.writelines(edited_chunks(source, edits))
+        return
+    with memoryview(source) as view, view.cast('B') as data:
+        file.writelines(edited_chunks(data, edits))
+
+def edited_chunks(source, edits):
+    encode = not isinstance(source, str)
+    position = 0
+    for edit in edits:
+        yield source[position:edit.start]
+        yield edit.text.encode('utf-8', 'surrogateescape') if encode else edit.text
+        position = edit.end
+    yield source[position:]
+
+@cached
+def to_array_of_plain_strings_or_json(input, limits=None):
+    parse_json = new_parser(input, limits)
     return parse_json.to_array_of_plain_strings_or_json()
 
-def can_parse_json(input):
-    parse_json = JsonParser(input)
+def iter_jsons(input, include_plain_text=False, limits=None):
+    parse_json = new_parser(input, limits)
+    if include_plain_text:
+        return parse_json.iter_plain_strings_or_json()
+    return (match.text for match in parse_json.iter_json_matches())
+
+def iter_json_matches(input, limits=None):
+    parse_json = new_parser(input, limits)
+    return parse_json.iter_json_matches()
+
+def iter_array_items(input, limits=None):
+    parse_json = new_parser(input, limits)
+    return (match.text for match in parse_json.iter_array_item_matches())
+
+@cached
+def can_parse_json(input, limits=None):
+    # Only objects count, as only objects are looked for in text
     try:
-        parse_json.repair_json()
+        parse_json = new_parser(input, limits)
+        if not parse_json.is_object():
+            return False
+        if parse_json.decoded is None:
+            parse_json.repair_json()
         return True
+    except JsonLimitError:
+        raise
     except Exception:
         return False
 
-def first_json(input):
-    parse_json = JsonParser(input)
-    result = parse_json.to_array_of_plain_strings_or_json()
-    for item in result:
-        if can_parse_json(item):
-            return item
+@cached
+def first_json(input, limits=None):
+    for match in iter_json_matches(input, limits):
+        if match.is_valid():
+            return match.text
     return ""
 
-def last_json(input):
-    parse_json = JsonParser(input)
-    result = parse_json.to_array_of_plain_strings_or_json()
-    for i in range(len(result) - 1, -1, -1):
-        if can_parse_json(result[i]):
-            return result[i]
+@cached
+def last_json(input, limits=None):
+    parse_json = new_parser(input, limits)
+    match = parse_json.last_json_match()
+    if match is None:
+        return ""
+    return match.text
+
+@cached
+def largest_json(input, limits=None):
+    # Largest first, and the sort is stable so the first of the same length wins,
+    # so usually only the answer itself needs to be checked
+    matches = sorted(iter_json_matches(input, limits), key=lambda match: len(match.text), reverse=True)
+    for match in matches:
+        if match.is_valid():
+            return match.text
     return ""
 
-def largest_json(input):
-    parse_json = JsonParser(input)
-    result = parse_json.to_array_of_plain_strings_or_json()
-    largest = ""
-    for item in result:
-        if can_parse_json(item) and len(item) > len(largest):
-            largest = item
-    return largest
-
-def json_matching(input, regex):
-    parse_json = JsonParser(input)
-    result = parse_json.to_array_of_plain_strings_or_json()
-    for item in result:
-        if can_parse_json(item) and regex.search(item):
-            return item
+@cached
+def json_matching(input, regex, limits=None):
+    for match in iter_json_matches(input, limits):
+        if regex.search(match.text) and match.is_valid():
+            return match.text
     return ""
 
+def repair_many(inputs, workers=None, chunksize=256):
+    return map_many(repair_json, inputs, workers, chunksize)
+
+def to_array_of_plain_strings_or_json_many(inputs, workers=None, chunksize=256):
+    return map_many(to_array_of_plain_strings_or_json, inputs, workers, chunksize)
+
+def first_json_many(inputs, workers=None, chunksize=256):
+    return map_many(first_json, inputs, workers, chunksize)
+
+def map_many(function, inputs, workers=None, chunksize=256):
+    # The parser is pure Python, so spread the inputs over worker processes. They are
+    # sent in batches of chunksize to keep the pickling overhead down, and only a few
+    # batches per worker are in flight at once so memory stays bounded.
+    inputs = iter(inputs)
+    batches = iter(lambda: list(itertools.islice(inputs, chunksize)), [])
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        for batch in batches:
+            yield from call_each(function, batch)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(executor.submit(call_each, function, batch))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def call_each(function, batch):
+    # An input that cannot be repaired gives its exception as the result, so one
+    # bad input does not lose the results of the rest of the batch
+    results = []
+    for input in batch:
+        try:
+            results.append(function(input))
+        except Exception as e:
+            results.append(e)
+    return results
+
+async def arepair_json(input, executor=None, yield_every=None):
+    # Chunks from an async iterator are repaired as they arrive, overlapping with
+    # receiving the rest. Text is repaired on the executor, or with yield_every it is
+    # repaired on the event loop in slices of that many characters, giving other
+    # tasks a turn between slices. The streaming parser only repairs objects, so
+    # anything else, or an object it fails on, is repaired by repair_json on the
+    # executor once all of it is there, and the result is always what repair_json gives.
+    if hasattr(input, '__aiter__'):
+        return await arepair_chunks(input, executor, yield_every)
+    if yield_every is None:
+        return await run_in_executor(executor, repair_json, input)
+    text = input if isinstance(input, str) else str(input, 'utf-8', 'surrogateescape')
+    if first_json_char(text) in ('{', '['):
+        normalized = await normalize_valid_json_in_slices(text, yield_every, executor)
+        if normalized is not None:
+            return normalized
+    if first_json_char(text) == '{':
+        parser = StreamingJsonParser()
+        try:
+            await feed_in_slices(parser, text, yield_every)
+            return parser.close()
+        except Exception:
+            pass
+    return await run_in_executor(executor, repair_json, input)
+
+async def arepair_chunks(input, executor, yield_every):
+    chunks = []
+    parser = StreamingJsonParser()
+    # Whether the chunks hold an object, which is only known from the first of
+    # them that is not all whitespace
+    streaming = None
+    # A character can be split between chunks of bytes
+    decoder = codecs.getincrementaldecoder('utf-8')('surrogateescape')
+    async for chunk in input:
+        chunks.append(chunk)
+        if streaming is False:
+            continue
+        text = chunk if isinstance(chunk, str) else decoder.decode(chunk)
+        if streaming is None and text.strip():
+            streaming = first_json_char(text) == '{'
+        if streaming:
+            try:
+                await feed_in_slices(parser, text, yield_every)
+            except Exception:
+                streaming = False
+    input = join_text(chunks)
+    # Valid JSON is only normalized by repair_json, not repaired
+    text = input if isinstance(input, str) else str(input, 'utf-8', 'surrogateescape')
+    if first_json_char(text) in ('{', '['):
+        normalized = await normalize_valid_json_in_slices(text, yield_every or ASYNC_SLICE, executor)
+        if normalized is not None:
+            return normalized
+    if streaming:
+        try:
+            parser.feed(decoder.decode(b'', final=True))
+            return parser.close()
+        except Exception:
+            pass
+    return await run_in_executor(executor, repair_json, input)
+
+def first_json_char(text):
+    start = WHITESPACE_REGEX.match(text).end()
+    return text[start:start + 1]
+
+async def normalize_valid_json_in_slices(text, size, executor):
+    # Gives what repair_json gives for text that is a valid JSON object or array, or
+    # None when it is not valid JSON. json and the normalizing would each hold on to
+    # the GIL for as long as the text takes, even on the executor, so the text is
+    # checked and normalized a slice of about size characters at a time instead,
+    # giving other tasks a turn between slices.
+    import asyncio
+    normalizer = JsonParser('')
+    parts = []
+    skeleton = ''
+    start = 0
+    while start < len(text):
+        window = size
+        while True:
+            end = min(len(text), start + window)
+            if end < len(text):
+                end = SLICE_END_REGEX.match(text, start, end).end()
+                end = start + len(text[start:end].rstrip(SLICE_SCALAR_CHARS))
+            if end > start:
+                break
+            # A string, number or keyword longer than the window
+            window *= 2
+        piece = text[start:end]
+        if '\x01' in piece or '\x02' in piece:
+            return None
+        if LONG_INTEGER_REGEX.search(piece):
+            return await run_in_executor(executor, valid_json_normalized, text)
+        depth = skeleton.count('{') + skeleton.count('[')
+        piece_skeleton = VALID_SCALAR_REGEX.sub('\x02', VALID_STRING_REGEX.sub('\x01', piece))
+        skeleton += VALID_WHITESPACE_REGEX.sub('', piece_skeleton)
+        if NOT_SKELETON_REGEX.search(skeleton):
+            return None
+        skeleton, passes = reduce_skeleton(skeleton)
+        if depth + passes + skeleton.count('{') + skeleton.count('[') > SLICE_MAX_DEPTH:
+            return await run_in_executor(executor, valid_json_normalized, text)
+        if skeleton != '\x02' and not SKELETON_PREFIX_REGEX.fullmatch(skeleton):
+            return None
+        parts.append(normalizer.normalize_valid_json(piece))
+        start = end
+        await asyncio.sleep(0)
+    if skeleton != '\x02':
+        return None
+    return ''.join(parts)
+
+def reduce_skeleton(skeleton):
+    # Returns the skeleton with the objects and arrays that are complete in it reduced,
+    # and how many passes that took, which is how deep they went
+    passes = 0
+    while True:
+        skeleton, count = SKELETON_CONTAINER_REGEX.subn('\x02', skeleton)
+        skeleton = SKELETON_MEMBERS_REGEX.sub('{\x01:\x02,', skeleton)
+        skeleton = SKELETON_ITEMS_REGEX.sub('[\x02,', skeleton)
+        if not count:
+            return skeleton, passes
+        passes += 1
+
+def valid_json_normalized(text):
+    parse_json = JsonParser(text)
+    return parse_json.repair_json() if parse_json.decoded is not None else None
+
+async def afirst_json(input, executor=None):
+    text = await join_chunks(input)
+    return await run_in_executor(executor, first_json, text)
+
+async def alog_jsons(input, executor=None):
+    text = await join_chunks(input)
+    await run_in_executor(executor, log_jsons, text)
+
+async def aiter_jsons(input, include_plain_text=False, executor=None):
+    # Each item is found on the executor, so however large an object is, finding
+    # it does not hold up the event loop
+    text = await join_chunks(input)
+    items = iter_jsons(text, include_plain_text)
+    end = object()
+    while True:
+        item = await run_in_executor(executor, next, items, end)
+        if item is end:
+            return
+        yield item
+
+async def feed_in_slices(parser, text, yield_every):
+    import asyncio
+    if yield_every is None:
+        parser.feed(text)
+        return
+    for start in range(0, len(text), yield_every):
+        parser.feed(text[start:start + yield_every])
+        await asyncio.sleep(0)
+
+async def join_chunks(input):
+    if not hasattr(input, '__aiter__'):
+        return input
+    chunks = []
+    async for chunk in input:
+        chunks.append(chunk)
+    return join_text(chunks)
+
+def join_text(chunks):
+    # Chunks of bytes are joined into bytes, which the functions take as well as text
+    if chunks and not isinstance(chunks[0], str):
+        return b''.join(chunks)
+    return ''.join(chunks)
+
+async def run_in_executor(executor, function, *args):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, function, *args)
+
+class JsonMatch:
+    """A JSON object found in text.
+
+    start and end are the offsets of the object in the text that was searched,
+    text is the repaired JSON and value is the decoded object, which is only
+    worked out the first time it is asked for.
+    """
+
+    __slots__ = ('start', 'end', 'text', '_value', '_error')
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+        self._value = None
+        self._error = None
+
+    @property
+    def value(self):
+        if self._value is None and self._error is None:
+            try:
+                self._value = json.loads(self.text)
+            except (ValueError, RecursionError):
+                # Some escaping is only fixed up by a second repair, and a repair can
+                # build values nested deeper than json.loads can
+                try:
+                    self._value = repair_to_object(self.text)
+                except Exception as e:
+                    self._error = e
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def is_valid(self):
+        try:
+            self.value
+            return True
+        except Exception:
+            return can_parse_json(self.text)
+
+    def __repr__(self):
+        return f'<JsonMatch span=({self.start}, {self.end}) text={self.text!r}>'
+
+class JsonEdit:
+    """A change that repairs JSON: the text from start to end is replaced with text.
+
+    When start and end are the same it is an insert, and when text is empty a delete.
+    """
+
+    __slots__ = ('start', 'end', 'text')
+
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+    @property
+    def kind(self):
+        if self.start == self.end:
+            return 'insert'
+        if not self.text:
+            return 'delete'
+        return 'replace'
+
+    def __repr__(self):
+        return f'<JsonEdit {self.kind} span=({self.start}, {self.end}) text={self.text!r}>'
+
+class JsonTextBuilder:
+    """Receives the repaired tokens from JsonParser and formats them as JSON text."""
+
+    def __init__(self):
+        self.parts = []
+        self.first = True
+
+    def separate(self):
+        if not self.first:
+            self.parts.append(', ')
+
+    def start_object(self):
+        self.separate()
+        self.parts.append('{ ')
+        self.first = True
+
+    def end_object(self):
+        self.parts.append(' }')
+        self.first = False
+
+    def start_array(self):
+        self.separate()
+        self.parts.append('[')
+        self.first = True
+
+    def end_array(self):
+        self.parts.append(']')
+        self.first = False
+
+    def key(self, text):
+        self.separate()
+        self.parts.append(text + ': ')
+        self.first = True
+
+    def scalar(self, text):
+        self.separate()
+        self.parts.append(text)
+        self.first = False
+
+    def string(self, text):
+        self.scalar(text)
+
+    def number(self, text):
+        self.scalar(text)
+
+    def keyword(self, text):
+        self.scalar(text)
+
+    def result(self):
+        return ''.join(self.parts)
+
+
+class JsonValueBuilder:
+    """Receives the repaired tokens from JsonParser and builds the equivalent Python objects."""
+
+    def __init__(self):
+        self.containers = []
+        self.keys = []
+        self.value = None
+
+    def add(self, value):
+        if not self.containers:
+            self.value = value
+        elif isinstance(self.containers[-1], list):
+            self.containers[-1].append(value)
+        else:
+            self.containers[-1][self.keys[-1]] = value
+
+    def start_object(self):
+        self.containers.append({})
+        self.keys.append(None)
+
+    def end_object(self):
+        self.keys.pop()
+        self.add(self.containers.pop())
+
+    def start_array(self):
+        self.containers.append([])
+        self.keys.append(None)
+
+    def end_array(self):
+        self.keys.pop()
+        self.add(self.containers.pop())
+
+    def key(self, text):
+        self.keys[-1] = decode_string(text)
+
+    def string(self, text):
+        self.add(decode_string(text))
+
+    def number(self, text):
+        self.add(decode_number(text))
+
+    def keyword(self, text):
+        self.add(KEYWORDS[text])
+
+    def result(self):
+        return self.value
+
+
+class FirstValueJsonValueBuilder(JsonValueBuilder):
+    """A JsonValueBuilder that keeps the first value of a key that appears twice in an object."""
+
+    def add(self, value):
+        if self.containers and isinstance(self.containers[-1], dict):
+            self.containers[-1].setdefault(self.keys[-1], value)
+        else:
+            super().add(value)
+
+
+class JsonHandler:
+    """Receives the repaired JSON from repair_events as events, without it being built.
+
+    Override the methods for the events you need. Keys and values are passed
+    decoded, as the str, int, float, bool or None they are in Python.
+    """
+
+    def on_start_object(self):
+        pass
+
+    def on_end_object(self):
+        pass
+
+    def on_start_array(self):
+        pass
+
+    def on_end_array(self):
+        pass
+
+    def on_key(self, key):
+        pass
+
+    def on_value(self, value):
+        pass
+
+
+class JsonHandlerBuilder:
+    """Receives the repaired tokens from JsonParser and passes them on to a JsonHandler."""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def start_object(self):
+        self.handler.on_start_object()
+
+    def end_object(self):
+        self.handler.on_end_object()
+
+    def start_array(self):
+        self.handler.on_start_array()
+
+    def end_array(self):
+        self.handler.on_end_array()
+
+    def key(self, text):
+        self.handler.on_key(decode_string(text))
+
+    def string(self, text):
+        self.handler.on_value(decode_string(text))
+
+    def number(self, text):
+        self.handler.on_value(decode_number(text))
+
+    def keyword(self, text):
+        self.handler.on_value(KEYWORDS[text])
+
+    def result(self):
+        return None
+
+
+KEYWORDS = {'true': True, 'false': False, 'null': None}
+
+def decode_string(text):
+    return json.decoder.scanstring(text, 1, False)[0]
+
+def decode_number(text):
+    if '.' in text or 'e' in text:
+        return float(text)
+    return int(text)
+
+def replay_events(value, handler):
+    # Valid JSON is decoded by json, and its events are replayed from the decoded
+    # value. The value is walked with a stack rather than by recursing, like the parser.
+    stack = [(iter((value,)), False)]
+    while stack:
+        items, in_object = stack[-1]
+        for item in items:
+            if in_object:
+                key, item = item
+                handler.on_key(key)
+            if isinstance(item, dict):
+                handler.on_start_object()
+                stack.append((iter(item.items()), True))
+                break
+            if isinstance(item, list):
+                handler.on_start_array()
+                stack.append((iter(item), False))
+                break
+            handler.on_value(item)
+        else:
+            stack.pop()
+            if not stack:
+                return
+            if in_object:
+                handler.on_end_object()
+            else:
+                handler.on_end_array()
+
+
+def parse_json_path(path):
+    # Turns "$.a.b[0]['c d']" into ('a', 'b', 0, 'c d')
+    if not path.startswith('$'):
+        raise ValueError(f'Path must start with $: {path}')
+    steps = []
+    position = 1
+    while position < len(path):
+        match = JSON_PATH_REGEX.match(path, position)
+        if match is None:
+            raise ValueError(f'Path not recognized at position {position}: {path}')
+        name, index, single_quoted, double_quoted = match.groups()
+        if index is not None:
+            steps.append(int(index))
+        elif name is not None:
+            steps.append(name)
+        else:
+            steps.append(re.sub(r'\\(.)', r'\1', single_quoted if single_quoted is not None else double_quoted))
+        position = match.end()
+    return tuple(steps)
+
+def find_json_path(value, steps):
+    # Returns (True, the value at steps in value) or (False, None) when it is not there
+    for step in steps:
+        if isinstance(step, int) and isinstance(value, list) and step < len(value):
+            value = value[step]
+        elif isinstance(step, str) and isinstance(value, dict) and step in value:
+            value = value[step]
+        else:
+            return False, None
+    return True, value
+
+
+class PathsFound(Exception):
+    """Raised by JsonPathBuilder to stop the parse once every path has been found."""
+
+
+class JsonPathBuilder:
+    """Receives the repaired tokens from JsonParser and builds only the values at the paths asked for.
+
+    Only the objects and arrays on the way to a path are followed, everything else
+    is skipped over without being built, and PathsFound is raised as soon as every
+    path has a value, so the rest of the text is not parsed at all. Stopping early
+    means the first value of a key that appears twice is the one used, both for the
+    key itself and for the objects built at the paths.
+    """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.wanted = collections.defaultdict(list)
+        for path in self.paths:
+            self.wanted[parse_json_path(path)].append(path)
+        self.prefixes = set(steps[:end] for steps in self.wanted for end in range(len(steps)))
+        self.found = {}
+        # The key or array index of each object or array being followed, and the keys
+        # seen so far in each object being followed
+        self.steps = []
+        self.keys = []
+        # How deep into a skipped object or array the parse is
+        self.skipped = 0
+        self.capture = None
+        self.capture_steps = None
+        self.capture_depth = 0
+
+    def next_steps(self):
+        if self.steps and isinstance(self.steps[-1], int):
+            self.steps[-1] += 1
+        return tuple(self.steps)
+
+    def add(self, steps, value):
+        for path in self.wanted.pop(steps):
+            self.found[path] = value
+        # Paths inside the value are looked up in it
+        for inner_steps in [inner_steps for inner_steps in self.wanted if inner_steps[:len(steps)] == steps]:
+            is_found, inner_value = find_json_path(value, inner_steps[len(steps):])
+            if is_found:
+                for path in self.wanted.pop(inner_steps):
+                    self.found[path] = inner_value
+        if not self.wanted:
+            raise PathsFound()
+
+    def start_container(self, start, step):
+        if self.capture is not None:
+            self.capture_depth += 1
+            getattr(self.capture, start)()
+        elif self.skipped:
+            self.skipped += 1
+        else:
+            steps = self.next_steps()
+            if steps in self.wanted:
+                self.capture = FirstValueJsonValueBuilder()
+                self.capture_steps = steps
+                self.capture_depth = 1
+                getattr(self.capture, start)()
+            elif steps in self.prefixes:
+                self.steps.append(step)
+                self.keys.append(set())
+            else:
+                self.skipped = 1
+
+    def end_container(self, end):
+        if self.capture is not None:
+            getattr(self.capture, end)()
+            self.capture_depth -= 1
+            if not self.capture_depth:
+                capture, self.capture = self.capture, None
+                self.add(self.capture_steps, capture.result())
+        elif self.skipped:
+            self.skipped -= 1
+        else:
+            self.steps.pop()
+            self.keys.pop()
+
+    def value(self, add, text):
+        if self.capture is not None:
+            getattr(self.capture, add)(text)
+        elif not self.skipped:
+            steps = self.next_steps()
+            if steps in self.wanted:
+                builder = JsonValueBuilder()
+                getattr(builder, add)(text)
+                self.add(steps, builder.result())
+
+    def start_object(self):
+        self.start_container('start_object', None)
+
+    def end_object(self):
+        self.end_container('end_object')
+
+    def start_array(self):
+        self.start_container('start_array', -1)
+
+    def end_array(self):
+        self.end_container('end_array')
+
+    def key(self, text):
+        if self.capture is not None:
+            self.capture.key(text)
+        elif not self.skipped:
+            key = decode_string(text)
+            # The value of a key seen before is skipped, as no path can lead to it
+            self.steps[-1] = None if key in self.keys[-1] else key
+            self.keys[-1].add(key)
+
+    def string(self, text):
+        self.value('string', text)
+
+    def number(self, text):
+        self.value('number', text)
+
+    def keyword(self, text):
+        self.value('keyword', text)
+
+    def result(self):
+        return {path: self.found[path] for path in self.paths if path in self.found}
+
+
+class JsonEditBuilder:
+    """Receives the repaired tokens from JsonParser and works out the edits that make the text being parsed valid JSON.
+
+    Each token, and what is between it and the one before, is compared with what
+    should be there, so only what is wrong is changed and the layout is kept.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.text = parser.inspected
+        self.edits = []
+        self.end = 0
+        self.separator = ''
+
+    def bracket(self, separator):
+        # Brackets are passed on before the parser has moved past them, and are
+        # always what they should be
+        start = self.parser.position
+        if self.text[self.end:start].strip(' \t\n\r') != self.separator:
+            self.separate(start)
+        self.end = start + 1
+        self.separator = separator
+
+    def token(self, text, separator):
+        # Keys and scalars are passed on once the parser has moved past them, and
+        # started at the parser's checkpoint
+        start = self.parser.checkpoint
+        end = self.parser.position
+        if self.text[self.end:start].strip(' \t\n\r') != self.separator:
+            self.separate(start)
+        if self.text[start:end] != text:
+            self.edits.append(JsonEdit(start, end, text))
+        self.end = end
+        self.separator = separator
+
+    def separate(self, start):
+        gap = GAP_REGEX.match(self.text, self.end, start)
+        if gap.group(1):
+            self.edits.append(JsonEdit(gap.start(1), gap.end(1), self.separator))
+        else:
+            # A missing separator goes straight after the token before it
+            self.edits.append(JsonEdit(self.end, self.end, self.separator))
+
+    def start_object(self):
+        self.bracket('')
+
+    def end_object(self):
+        self.separator = ''
+        self.bracket(',')
+
+    def start_array(self):
+        self.bracket('')
+
+    def end_array(self):
+        self.separator = ''
+        self.bracket(',')
+
+    def key(self, text):
+        self.token(text, ':')
+
+    def string(self, text):
+        self.token(text, ',')
+
+    def number(self, text):
+        self.token(text, ',')
+
+    def keyword(self, text):
+        self.token(text, ',')
+
+    def result(self):
+        # Anything after the object is dropped, as it is by repair_json
+        if self.text[self.end:].strip(' \t\n\r'):
+            self.separator = ''
+            self.separate(len(self.text))
+        return self.edits
+
+
+class Utf8Buffer:
+    """UTF-8 text held in bytes, bytearray, memoryview or mmap.
+
+    Has the parts of the str interface that finding JSON in text needs, with offsets
+    in bytes, and only decodes the slices that are asked for.
+    """
+
+    def __init__(self, buffer):
+        if isinstance(buffer, memoryview):
+            buffer = buffer.cast('B')
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def is_string(self):
+        # Only text starting with a quote could be stringified JSON
+        return re.match(rb'\s*"', self.buffer) is not None
+
+    def __getitem__(self, key):
+        return str(self.buffer[key], 'utf-8', 'surrogateescape')
+
+    def find(self, char, start=0, end=None):
+        if end is None:
+            end = len(self.buffer)
+        match = re.compile(re.escape(char.encode('utf-8'))).search(self.buffer, start, end)
+        if match is None:
+            return -1
+        return match.start()
+
+    def rfind(self, char, start=0, end=None):
+        # memoryview has no rfind, so look back through the buffer a block at a time
+        char = char.encode('utf-8')
+        if end is None:
+            end = len(self.buffer)
+        while end > start:
+            block_start = max(start, end - 65536)
+            position = bytes(self.buffer[block_start:end]).rfind(char)
+            if position != -1:
+                return block_start + position
+            end = block_start
+        return -1
+
+    def byte_offsets(self, text, offsets):
+        # The byte offsets of the given character offsets into text decoded from the buffer
+        result = []
+        previous = 0
+        byte_offset = 0
+        for offset in sorted(offsets):
+            byte_offset += len(text[previous:offset].encode('utf-8', 'surrogateescape'))
+            previous = offset
+            result.append(byte_offset)
+        return result
+
+
 class JsonParser:
-    def __init__(self, input):
-        self.inspected = self.de_stringify(input)
+    """Repairs one input, keeping all of the state of the repair in its attributes.
+
+    The module functions make a new parser for every call, so they can be called
+    from any number of threads at once. A parser itself is not to be shared between
+    threads, and neither is a StreamingJsonParser.
+    """
+
+    def __init__(self, input, limits=None, unstringify=True):
+        # With unstringify False the input is searched as it is, even if it is
+        # stringified JSON, which saves decoding all of a large buffer to find out
+        self.input = input
+        self.decoded = None
+        self.limits = limits
+        if limits is not None:
+            self.start_limits(input)
+        if not isinstance(input, str):
+            # Text in a byte buffer is only decoded where there might be JSON
+            input = Utf8Buffer(input)
+            if unstringify and input.is_string():
+                # Stringified JSON is searched once it is unstringified, like a str would be
+                text = input[:]
+                if self.de_stringify(text) != text:
+                    input = text
+        if isinstance(input, str):
+            self.inspected = self.de_stringify(input) if unstringify else input
+            self.source = self.inspected
+            self.stringified = self.inspected is not input
+        else:
+            self.inspected = ''
+            self.source = input
+            self.stringified = False
         self.reset_pointer()
-        self.debug = False
+        self.builder = JsonTextBuilder()
+        self.incomplete_position = None
+        # Byte offsets in a buffer where a scan of each kind first ran out, see ran_out
+        self.buffer_runs_out = {}
+        # Byte offsets in a buffer of failed_member_positions, in sets by window sized block
+        self.buffer_failed_members = {}
+
+    def start_limits(self, input):
+        limits = self.limits
+        length = len(input) if isinstance(input, str) else memoryview(input).nbytes
+        if limits.max_input_length is not None and length > limits.max_input_length:
+            raise JsonInputLimitError(f'Input of length {length} is longer than {limits.max_input_length}')
+        if limits.max_seconds is not None:
+            self.deadline = time.perf_counter() + limits.max_seconds
+        self.steps = 0
+        self.attempts = 0
+        self.counted_builder = None
+
+    def check_limits(self, depth):
+        # Called for every step of the parse, only when there are limits
+        limits = self.limits
+        if limits.max_depth is not None and depth > limits.max_depth:
+            raise JsonDepthLimitError(f'Nested deeper than {limits.max_depth} at position {self.position}')
+        self.steps += 1
+        if limits.max_steps is not None and self.steps > limits.max_steps:
+            raise JsonStepLimitError(f'More than {limits.max_steps} steps at position {self.position}')
+        if limits.max_seconds is not None and time.perf_counter() > self.deadline:
+            raise JsonTimeLimitError(f'Took more than {limits.max_seconds} s at position {self.position}')
+        if limits.max_output_length is not None and not self.steps % 16 and isinstance(self.builder, JsonTextBuilder):
+            # The output is counted every 16 steps, from where it was counted up to the
+            # time before, and its final length is checked by check_output
+            builder = self.builder
+            if builder is not self.counted_builder:
+                self.counted_builder = builder
+                self.counted_parts = 0
+                self.output_length = 0
+            parts = builder.parts
+            self.output_length += sum(map(len, parts[self.counted_parts:]))
+            self.counted_parts = len(parts)
+            if self.output_length > limits.max_output_length:
+                raise JsonOutputLimitError(f'Output longer than {limits.max_output_length} at position {self.position}')
+
+    def check_output(self, text):
+        if self.limits is not None and self.limits.max_output_length is not None and len(text) > self.limits.max_output_length:
+            raise JsonOutputLimitError(f'Output of length {len(text)} is longer than {self.limits.max_output_length}')
+        return text
+
+    def check_attempts(self):
+        if self.limits is not None and self.limits.max_attempts is not None:
+            self.attempts += 1
+            if self.attempts > self.limits.max_attempts:
+                raise JsonAttemptLimitError(f'More than {self.limits.max_attempts} objects failed to parse')
 
     def reset_pointer(self):
         self.position = 0
-        self.quoted = ''
+        self.quoted = []
         self.checkpoint = 0
-        self.checkpoint_quoted = ''
-        self.quoted_last_comma_position = None
+        self.checkpoint_quoted = []
+        self.failed_object_positions = set()
+        # Where members of objects that failed to parse started, see eat_nested_values
+        self.failed_member_positions = set()
+        # Where a scan of each kind first ran out of text, see ran_out
+        self.runs_out = {}
+
+    def fail_if_runs_out(self, kind):
+        start = self.runs_out.get(kind)
+        if start is not None and self.position >= start:
+            raise JsonFixError('Unexpected end of input')
+
+    def ran_out(self, kind, start):
+        # Whether a key or string ends only depends on the characters the scan of it
+        # comes to, so once a scan of a kind has run from start to the end of the
+        # text, any scan of the same kind that starts later would run out as well.
+        # Failing those straight away stops every open brace inside a long unclosed
+        # key or string from scanning to the end of the text again.
+        if start < self.runs_out.get(kind, start + 1):
+            self.runs_out[kind] = start
 
     def set_checkpoint(self):
-        if self.debug:
-            print('setCheckpoint', self.position, self.inspected[self.position])
         self.checkpoint = self.position
         self.checkpoint_quoted = self.quoted
 
+    def decode_source(self):
+        # Repairing uses all of the text, so all of a byte buffer has to be decoded
+        if isinstance(self.source, Utf8Buffer):
+            self.inspected = self.de_stringify(self.source[:])
+            self.source = self.inspected
+
     def repair_json(self):
+        self.decode_source()
+        if self.decoded is not None:
+            return self.check_output(self.normalize_valid_json(self.inspected))
+        self.reset_pointer()
+        self.builder = JsonTextBuilder()
+        self.eat_json()
+        return self.check_output(self.builder.result())
+
+    def repair_edits(self):
+        # Edits are offsets into the text as it was given, so stringified JSON, which
+        # is only repaired once it has been unstringified, is replaced as a whole
+        if self.stringified:
+            return [JsonEdit(0, len(self.input), self.repair_json())]
+        buffer = self.source if isinstance(self.source, Utf8Buffer) else None
+        self.decode_source()
+        if self.decoded is not None:
+            return []
+        self.reset_pointer()
+        self.builder = JsonEditBuilder(self)
+        self.eat_json()
+        edits = self.builder.result()
+        if buffer is not None:
+            positions = sorted(set(itertools.chain.from_iterable((edit.start, edit.end) for edit in edits)))
+            offsets = dict(zip(positions, buffer.byte_offsets(self.inspected, positions)))
+            for edit in edits:
+                edit.start = offsets[edit.start]
+                edit.end = offsets[edit.end]
+        return edits
+
+    def repair_events(self, handler):
+        self.decode_source()
+        if self.decoded is not None:
+            replay_events(self.decoded, handler)
+            return
+        self.reset_pointer()
+        self.builder = JsonHandlerBuilder(handler)
+        self.eat_json()
+
+    def extract_paths(self, paths):
+        # Returns the values found at the paths, by path. Paths that are not in the
+        # JSON are left out, as their value cannot be told apart from null otherwise.
+        self.decode_source()
+        if self.decoded is not None:
+            # Decoded again, as decoded keeps the last value of a key that appears twice
+            decoded = FIRST_VALUE_JSON_DECODER.decode(self.inspected)
+            found = {}
+            for path in paths:
+                is_found, value = find_json_path(decoded, parse_json_path(path))
+                if is_found:
+                    found[path] = value
+            return found
         self.reset_pointer()
-        self.eat_object()
-        return self.quoted
+        self.builder = JsonPathBuilder(paths)
+        if not self.builder.wanted:
+            return {}
+        try:
+            self.eat_json()
+        except PathsFound:
+            pass
+        return self.builder.result()
+
+    def repair_value(self):
+        self.decode_source()
+        if self.decoded is not None:
+            return self.decoded
+        self.reset_pointer()
+        self.builder = JsonValueBuilder()
+        self.eat_json()
+        return self.builder.result()
 
     def de_stringify(self, string):
         try:
-            result = json.loads(string)
+            result = JSON_DECODER.decode(string)
             if isinstance(result, str):
-                return self.de_stringify(result)
+                # Only a string holding an object or array is stringified JSON, any other
+                # string is a value in its own right, and is kept as the string it is
+                inner = self.de_stringify(result)
+                if self.decoded is not None or inner.lstrip().startswith('{'):
+                    return inner
+                return string
+            if isinstance(result, (dict, list)):
+                self.decoded = result
+                if self.limits is not None and self.limits.max_depth is not None:
+                    self.check_decoded_depth()
             return string
+        except JsonLimitError:
+            raise
         except Exception as e:
             return string
 
+    def check_decoded_depth(self):
+        # Valid JSON is decoded by json, so its depth is found from the decoded value
+        stack = [(self.decoded, 1)]
+        while stack:
+            value, depth = stack.pop()
+            if depth > self.limits.max_depth:
+                raise JsonDepthLimitError(f'Nested deeper than {self.limits.max_depth}')
+            items = value.values() if isinstance(value, dict) else value
+            stack.extend((item, depth + 1) for item in items if isinstance(item, (dict, list)))
+
+    def normalize_valid_json(self, text):
+        # Valid JSON only needs the whitespace outside of strings normalized to match
+        # the repaired output, so leave the strings alone and rewrite what is between them
+        parts = JSON_STRING_REGEX.split(text)
+        if len(parts) == 1:
+            return self.normalize_between_strings(text)
+        # The text between the strings is normalized all at once, joined by a
+        # character that valid JSON cannot have outside of a string
+        between_strings = self.normalize_between_strings('\0'.join(parts[0::2]))
+        parts[0::2] = between_strings.split('\0')
+        return ''.join(parts)
+
+    def normalize_between_strings(self, text):
+        return (
+            ''.join(text.split()).lower()
+            .replace(',', ', ')
+            .replace(':', ': ')
+            .replace('{', '{ ')
+            .replace('}', ' }')
+        )
+
     def to_array_of_plain_strings_or_json(self):
-        result = []
+        return list(self.iter_plain_strings_or_json())
+
+    def iter_plain_strings_or_json(self, matches=None):
+        # Every open brace between two JSON objects is one that failed to parse,
+        # and is given back as an item of its own between the plain text around it
+        if matches is None:
+            matches = self.iter_json_matches()
+        end = 0
+        for match in matches:
+            yield from self.split_plain_text(self.source[end:match.start])
+            yield match.text
+            end = match.end
+        plain_texts = list(self.split_plain_text(self.source[end:]))
+        if plain_texts and plain_texts[-1] == '':
+            plain_texts.pop()
+        yield from plain_texts
+
+    def split_plain_text(self, text):
+        plain_texts = text.split('{')
+        yield plain_texts[0]
+        for plain_text in plain_texts[1:]:
+            yield '{'
+            yield plain_text
+
+    def iter_json_matches(self, start=0):
+        if isinstance(self.source, Utf8Buffer):
+            yield from self.iter_buffer_json_matches(start)
+            return
         self.reset_pointer()
-        recovery_position = 0
+        self.position = start
         while self.position < len(self.inspected):
-            self.quoted = ''
             self.eat_plain_text()
-            result.append(self.quoted)
-            self.quoted = ''
             if self.position >= len(self.inspected):
                 break
-            if self.inspected[self.position] == '{':
-                recovery_position = self.position + 1
-
-                try:
-                    self.eat_object()
-                except Exception as e:
-                    self.quoted += '{'
-                    self.position = recovery_position
+            start = self.position
+            if start in self.failed_object_positions:
+                self.position = start + 1
+                continue
+            self.builder = JsonTextBuilder()
+
+            try:
+                self.eat_object()
+            except JsonLimitError:
+                raise
+            except Exception as e:
+                self.check_attempts()
+                self.position = start + 1
+                continue
+
+            yield JsonMatch(start, self.position, self.check_output(self.builder.result()))
+
+    def iter_buffer_json_matches(self, start):
+        failed_positions = set()
+        self.incomplete_position = None
+        position = start
+        while True:
+            position = self.source.find('{', position)
+            if position == -1:
+                return
+            if position in failed_positions:
+                position += 1
+                continue
+            try:
+                self.eat_buffer_window(position, self.eat_object)
+            except JsonLimitError:
+                raise
+            except Exception as e:
+                self.check_attempts()
+                if self.incomplete_position is None and self.ran_into_window_end(e):
+                    # The object ran into the end of the buffer, so may be complete once more is written
+                    self.incomplete_position = position
+                for offset in self.source.byte_offsets(self.inspected, self.failed_object_positions):
+                    failed_positions.add(position + offset)
+                for offset in self.source.byte_offsets(self.inspected, self.failed_member_positions):
+                    start = position + offset
+                    self.buffer_failed_members.setdefault(start // BUFFER_WINDOW, set()).add(start)
+                position += 1
+                continue
+            end = position + self.source.byte_offsets(self.inspected, [self.position])[0]
+            yield JsonMatch(position, end, self.check_output(self.builder.result()))
+            position = end
+
+    def eat_buffer_window(self, position, eat):
+        # Only a window from position is decoded and parsed. The window is doubled
+        # while the parse gets near enough to the end of the window, or reads past it,
+        # that the rest of the buffer could have changed how it went.
+        window = BUFFER_WINDOW
+        while True:
+            window_end = min(len(self.source), position + window)
+            self.inspected = self.source[position:window_end]
+            self.reset_pointer()
+            self.start_window_runs_out(position, window_end)
+            self.start_window_failed_members(position, window_end)
+            self.builder = JsonTextBuilder()
+            try:
+                result = eat()
+                error = None
+            except JsonLimitError:
+                raise
+            except Exception as e:
+                error = e
+            if window_end == len(self.source) or not self.ran_into_window_end(error):
+                break
+            window *= 2
+        if window_end == len(self.source):
+            self.keep_window_runs_out(position)
+        if error is not None:
+            raise error
+        return result
 
-            result.append(self.quoted)
+    def ran_into_window_end(self, error):
+        # Lookahead such as eat_virtual_whitespace can read any distance from where the
+        # parse is, so a read past the end of the window, which is what an IndexError
+        # is, counts as well as a parse that ended near it
+        return isinstance(error, IndexError) or self.position + BUFFER_LOOKAHEAD >= len(self.inspected)
+
+    def start_window_runs_out(self, position, window_end):
+        # Each window is parsed as text of its own, so where scans ran out of the
+        # buffer is carried into it as offsets into the window
+        for kind, start in self.buffer_runs_out.items():
+            if start <= position:
+                self.runs_out[kind] = 0
+            elif start < window_end:
+                self.runs_out[kind] = len(self.source[position:start])
+
+    def start_window_failed_members(self, position, window_end):
+        blocks = range(position // BUFFER_WINDOW, (window_end - 1) // BUFFER_WINDOW + 1)
+        starts = sorted(
+            start for block in blocks for start in self.buffer_failed_members.get(block, ())
+            if position <= start < window_end
+        )
+        offset = 0
+        previous = position
+        for start in starts:
+            offset += len(self.source[previous:start])
+            previous = start
+            self.failed_member_positions.add(offset)
+
+    def keep_window_runs_out(self, position):
+        # Only a scan that ran out at the end of the buffer would run out at the end of
+        # a bigger window as well
+        kinds = list(self.runs_out)
+        starts = self.source.byte_offsets(self.inspected, [self.runs_out[kind] for kind in kinds])
+        for kind, start in zip(sorted(kinds, key=self.runs_out.get), starts):
+            start += position
+            if start < self.buffer_runs_out.get(kind, start + 1):
+                self.buffer_runs_out[kind] = start
+
+    def iter_array_item_matches(self):
+        # Each item is repaired on its own, and of a byte buffer only a window big
+        # enough for the item is decoded, so memory is bounded by the largest item
+        if isinstance(self.source, Utf8Buffer):
+            yield from self.iter_buffer_array_item_matches()
+            return
+        self.reset_pointer()
+        self.eat_array_start()
+        while True:
+            start = self.position
+            self.builder = JsonTextBuilder()
+            end = self.eat_array_item()
+            if end is None:
+                return
+            yield JsonMatch(start, end, self.check_output(self.builder.result()))
 
-        return result
+    def iter_buffer_array_item_matches(self):
+        self.eat_buffer_window(0, self.eat_array_start)
+        position = self.source.byte_offsets(self.inspected, [self.position])[0]
+        while True:
+            end = self.eat_buffer_window(position, self.eat_array_item)
+            if end is None:
+                return
+            end, next_position = self.source.byte_offsets(self.inspected, [end, self.position])
+            yield JsonMatch(position, position + end, self.check_output(self.builder.result()))
+            position += next_position
+
+    def last_json_match(self):
+        # Finding the last object by scanning from the start repairs every object in the
+        # text, so scan a window at the end instead, doubling it until the scan of the
+        # window can be trusted to agree with a scan of the whole text
+        text_length = len(self.source)
+        window = LAST_JSON_WINDOW
+        while True:
+            start = self.source.rfind('}', 0, max(0, text_length - window)) + 1
+            matches = list(self.iter_json_matches(start))
+            if start == 0 or not self.has_stray_close_brace(start, matches):
+                for match in reversed(matches):
+                    if match.is_valid():
+                        return match
+                if start == 0:
+                    return None
+            window *= 2
+
+    def has_stray_close_brace(self, start, matches):
+        # The window starts just after a close brace, so if the start of the window is
+        # inside an object, the close brace of that object is left over in the plain text.
+        # Only quotes mangled badly enough for objects to overlap can hide it.
+        end = start
+        for match in matches:
+            if self.source.find('}', end, match.start) != -1:
+                return True
+            end = match.end
+        return self.source.find('}', end) != -1
 
     def eat_plain_text(self):
-        while self.position < len(self.inspected) and self.inspected[self.position] != '{':
-            if self.debug:
-                print('eat_plain_text', self.position, self.inspected[self.position])
-            self.quoted += self.inspected[self.position]
-            self.position += 1
+        end = self.inspected.find('{', self.position)
+        if end == -1:
+            end = len(self.inspected)
+        plain_text = self.inspected[self.position:end]
+        self.position = end
+        return plain_text
+
+    def eat_json(self):
+        # A whole document can be any JSON value, not just an object. Text after an
+        # object or array is ignored, but a primitive has to be all there is, so that
+        # text that starts with a number or a word is not taken for one.
+        self.eat_whitespace()
+        if not self.is_value_start():
+            raise JsonFixError(f'Expected JSON value at position {self.position}')
+        if self.inspected[self.position] in '{[':
+            self.eat_value()
+            return
+        self.eat_value()
+        self.eat_whitespace()
+        if self.position < len(self.inspected):
+            raise JsonFixError(f'Unexpected text after JSON value at position {self.position}')
 
-    def eat_object(self):
-        if self.debug:
-            print('eat_object', self.position, self.inspected[self.position])
+    def is_value_start(self):
+        char = self.inspected[self.position]
+        if char in '{[' or self.get_quote() or self.is_number_start_char(char):
+            return True
+        return self.inspected[self.position:self.position + 5].lower().startswith(('true', 'false', 'null', 'none'))
+
+    def is_object(self):
+        self.decode_source()
+        start = WHITESPACE_REGEX.match(self.inspected).end()
+        return self.inspected[start:start + 1] == '{'
+
+    def eat_array_start(self):
         self.eat_whitespace()
-        self.eat_open_brace()
-        self.eat_key_value_pairs()
+        if self.position >= len(self.inspected) or self.inspected[self.position] != '[':
+            raise JsonFixError('Expected array')
+        self.position += 1
         self.eat_whitespace()
-        self.eat_close_brace()
 
-    def eat_key_value_pairs(self):
-        if self.debug:
-            print('eat_key_value_pairs', self.position, self.inspected[self.position])
-        while True:
-            self.eat_whitespace()
-            if self.inspected[self.position] == '}':
-                self.remove_trailing_comma_if_present()
-                break
-            self.quoted_last_comma_position = None
-            self.eat_key()
-            self.eat_whitespace()
-            self.eat_colon()
-            self.eat_whitespace()
-            self.eat_reference_optional()
+    def eat_array_item(self):
+        # Eats the next item of an array and what separates it from the item after,
+        # returning where the item ended, or None at the end of the array
+        if self.position >= len(self.inspected):
+            raise JsonFixError('Expected close bracket')
+        if self.inspected[self.position] == ']':
+            self.position += 1
+            return None
+        if not self.eat_valid_array_item():
+            if self.inspected.startswith('Circular', self.position):
+                self.eat_circular()
+            else:
+                self.eat_value()
+        end = self.position
+        self.eat_whitespace()
+        if self.inspected[self.position:self.position + 1] == ',':
+            self.position += 1
             self.eat_whitespace()
-            self.eat_value()
-            self.quoted_last_comma_position = None
+        return end
+
+    def eat_valid_array_item(self):
+        # Valid items are decoded by json, which is much faster than repairing them,
+        # as long as they are followed by what follows an item in valid JSON
+        try:
+            end = JSON_DECODER.raw_decode(self.inspected, self.position)[1]
+        except (ValueError, RecursionError):
+            # Items nested too deeply for json are left to the explicit stack of the engine
+            return False
+        next_position = WHITESPACE_REGEX.match(self.inspected, end).end()
+        if self.inspected[next_position:next_position + 1] not in ('', ',', ']'):
+            return False
+        self.builder.scalar(self.normalize_valid_json(self.inspected[self.position:end]))
+        self.position = end
+        return True
+
+    def eat_object(self):
+        self.eat_whitespace()
+        self.eat_open_brace()
+        self.eat_nested_values('}')
+
+    def eat_nested_values(self, closer):
+        # Nested objects and arrays are tracked on an explicit stack of the closing
+        # characters they are waiting for, rather than by recursing, so that deeply
+        # nested input cannot hit the recursion limit
+        closers = [closer]
+        positions = [self.position - 1]
+        members = []
+        try:
+            self.eat_nested_values_from_stack(closers, positions, members)
+        except JsonLimitError:
+            # Hitting a limit says nothing about whether the objects would parse
+            raise
+        except Exception:
+            # Parsing an object does not depend on what surrounds it, so every object
+            # still open when parsing failed would fail at the same place if it were
+            # parsed again on its own. Remember them so they are not retried.
+            for open_closer, position in zip(closers, positions):
+                if open_closer == '}':
+                    self.failed_object_positions.add(position)
+            # How the rest of an object is parsed only depends on where its next member
+            # starts, so an object that comes to a member where a failed object had one
+            # fails as well. Remember where they were, so that an attempt that runs
+            # into the members of an earlier attempt, as every brace inside a long run
+            # of mangled members does, stops there instead of going over them again.
+            if closer == '}':
+                self.failed_member_positions.update(members)
+            raise
+
+    def eat_nested_values_from_stack(self, closers, positions, members):
+        while closers:
+            if self.limits is not None:
+                self.check_limits(len(closers))
+            if len(closers) == 1 and closers[0] == '}':
+                if self.position in self.failed_member_positions:
+                    raise JsonFixError(f'Object already failed to parse from position {self.position}')
+                members.append(self.position)
             self.eat_whitespace()
+            if closers[-1] == '}':
+                if self.inspected[self.position] == '}':
+                    self.eat_close_brace()
+                    closers.pop()
+                    positions.pop()
+                    self.eat_comma_after_value_optional(closers)
+                    continue
+                self.eat_key()
+                self.eat_whitespace()
+                self.eat_colon()
+                self.eat_whitespace()
+                self.eat_reference_optional()
+                self.eat_whitespace()
+            else:
+                self.eat_circular_optional()
+                if self.inspected[self.position] == ']':
+                    self.eat_close_bracket()
+                    closers.pop()
+                    positions.pop()
+                    self.eat_comma_after_value_optional(closers)
+                    continue
+
+            if self.inspected[self.position] == '{':
+                positions.append(self.position)
+                self.eat_open_brace()
+                closers.append('}')
+            elif self.inspected[self.position] == '[':
+                positions.append(self.position)
+                self.eat_open_bracket()
+                closers.append(']')
+            else:
+                self.eat_value()
+                self.eat_comma_after_value_optional(closers)
 
-            if self.inspected[self.position] == ',':
-                self.eat_comma()
-            elif self.inspected[self.position] != '}':
-                self.quoted += ', '
+    def eat_comma_after_value_optional(self, closers):
+        if not closers:
+            return
+        self.eat_whitespace()
+        if self.inspected[self.position] == ',':
+            self.eat_comma()
 
     def eat_reference_optional(self):
         if self.inspected[self.position] == '<':
@@ -242,9 +1924,7 @@ class JsonParser:
         self.position += 1
 
     def eat_reference_number(self):
-        number_regex = re.compile(r'[0-9]')
-        while number_regex.match(self.inspected[self.position]):
-            self.position += 1
+        self.position = REFERENCE_NUMBER_REGEX.match(self.inspected, self.position).end()
 
     def eat_close_angle_bracket(self):
         if self.inspected[self.position] != '>':
@@ -258,44 +1938,33 @@ class JsonParser:
         return False
 
     def eat_whitespace(self):
-        whitespace_regex = re.compile(r'\s')
-        while whitespace_regex.match(self.inspected[self.position]):
-            self.position += 1
+        self.position = WHITESPACE_REGEX.match(self.inspected, self.position).end()
 
     def eat_open_brace(self):
-        if self.debug:
-            print('eat_open_brace', self.position, self.inspected[self.position])
         if self.inspected[self.position] != '{':
             raise JsonFixError('Expected open brace')
-        self.quoted += self.inspected[self.position] + ' '
+        self.builder.start_object()
         self.position += 1
 
     def eat_close_brace(self):
-        if self.debug:
-            print('eat_close_brace', self.position, self.inspected[self.position])
         if self.inspected[self.position] != '}':
             raise JsonFixError('Expected close brace')
-        self.quoted += ' ' + self.inspected[self.position]
+        self.builder.end_object()
         self.position += 1
 
     def eat_key(self):
-        if self.debug:
-            print('eat_key', self.position, self.inspected[self.position])
         if self.get_quote():
             self.eat_quoted_key()
         else:
             self.eat_unquoted_key()
 
     def get_quote(self):
-        if self.inspected[self.position] == "'":
-            return "'"
-        if self.inspected[self.position] == '"':
-            return '"'
-        if self.inspected[self.position] == '`':
-            return '`'
-        if self.inspected[self.position] == '“':
-            return '”'
-        if self.inspected[self.position] == '\\' and self.inspected[self.position + 1] == '"':
+        char = self.inspected[self.position]
+        if char in QUOTES:
+            return QUOTES[char]
+        if char != '\\':
+            return False
+        if self.inspected[self.position + 1] == '"':
             return '\\"'
         if (
             self.inspected[self.position] == '\\' and
@@ -333,43 +2002,57 @@ class JsonParser:
             virtual_position = self.eat_virtual_whitespace(self.position + 1)
             if self.inspected[virtual_position] == ':':
                 return
-            self.log('eatExtraStartingKeyDoubleQuote')
             self.position += 1
 
     def eat_quoted_key(self):
-        self.log('eatQuotedKey')
         self.set_checkpoint()
         self.throw_if_json_special_character(self.inspected[self.position])
         quote = self.get_quote()
-        self.quoted += '"'
+        start = self.position
+        self.fail_if_runs_out(('key', quote))
+        self.quoted = ['"']
         self.position += 1
         self.eat_long_quote(quote)
         self.eat_extra_starting_key_double_quote(quote)
-        while not self.check_quote(quote):
-            self.eat_char_or_escaped_char(quote)
-        self.log('eatQuotedKey end')
-        self.quoted += '"'
+        try:
+            while True:
+                self.eat_plain_string_chars()
+                if self.check_quote(quote):
+                    break
+                self.eat_char_or_escaped_char(quote)
+        except (IndexError, JsonFixError):
+            if len(quote) == 1:
+                self.ran_out(('key', quote), start)
+            raise
         self.position += 1
         self.eat_long_quote(quote)
+        self.builder.key(''.join(self.quoted) + '"')
 
     def eat_unquoted_key(self):
-        if self.debug:
-            print('eat_unquoted_key', self.position, self.inspected[self.position])
         self.set_checkpoint()
         if self.inspected[self.position] == '[':
             return self.eat_null_key()
         self.throw_if_json_special_character(self.inspected[self.position])
-        self.quoted += '"'
-        while self.inspected[self.position] != ':' and self.inspected[self.position] != ' ':
-            if self.get_quote():
-                raise JsonFixError('Unexpected quote in unquoted key')
-            self.quoted += self.inspected[self.position]
-            self.position += 1
-        self.quoted += '"'
+        start = self.position
+        self.fail_if_runs_out('unquoted key')
+        self.quoted = ['"']
+        try:
+            while True:
+                end = PLAIN_UNQUOTED_KEY_REGEX.match(self.inspected, self.position).end()
+                self.quoted.append(self.inspected[self.position:end])
+                self.position = end
+                if self.inspected[self.position] == ':' or self.inspected[self.position] == ' ':
+                    break
+                if self.get_quote():
+                    raise JsonFixError('Unexpected quote in unquoted key')
+                self.quoted.append(self.inspected[self.position])
+                self.position += 1
+        except IndexError:
+            self.ran_out('unquoted key', start)
+            raise
+        self.builder.key(''.join(self.quoted) + '"')
 
     def eat_null_key(self):
-        if self.debug:
-            print('eat_null_key', self.position, self.inspected[self.position])
         if self.inspected[self.position] != '[':
             raise JsonFixError('Expected open bracket')
         self.position += 1
@@ -388,68 +2071,61 @@ class JsonParser:
         if self.inspected[self.position] != ']':
             raise JsonFixError('Expected close bracket')
         self.position += 1
-        self.quoted += '"null"'
+        self.builder.key('"null"')
 
     def throw_if_json_special_character(self, char):
-        if char in ['{', '}', '[', ']', ':', ',']:
+        if char in JSON_SPECIAL_CHARACTERS:
             raise JsonFixError(f'Unexpected character {char} at position {self.position}')
 
     def eat_colon(self):
-        if self.debug:
-            print('eat_colon', self.position, self.inspected[self.position])
         if self.inspected[self.position] != ':':
             raise JsonFixError('Expected colon')
-        self.quoted += self.inspected[self.position] + ' '
         self.position += 1
 
     def eat_value(self):
-        if self.debug:
-            print('eat_value', self.position, self.inspected[self.position])
         if self.inspected[self.position] == '{':
             self.eat_object()
         elif self.get_quote():
             self.eat_string()
             self.eat_concatenated_strings()
+            self.builder.string(''.join(self.quoted) + '"')
         elif self.inspected[self.position] == '[':
             self.eat_array()
         else:
             self.eat_primitive()
 
     def eat_string(self):
-        if self.debug:
-            print('eat_string', self.position, self.inspected[self.position])
         self.set_checkpoint()
         quote = self.get_quote()
-        self.quoted += '"'
+        start = self.position
+        self.fail_if_runs_out(('string', quote))
+        self.quoted = ['"']
         self.position += 1
         self.eat_long_quote(quote)
-        while not self.is_end_quote_making_allowance_for_unescaped_single_quote(quote):
-            self.eat_char_or_escaped_char(quote)
-        self.quoted += '"'
+        try:
+            self.eat_string_chars(quote)
+        except (IndexError, JsonFixError):
+            if len(quote) == 1:
+                self.ran_out(('string', quote), start)
+            raise
         self.position += 1
         self.eat_long_quote(quote)
 
     def eat_concatenated_strings(self):
-        if self.debug:
-            print('eat_concatenated_strings', self.position, self.inspected[self.position])
-        virtual_position = self.eat_virtual_whitespace(self.position + 1)
-        if self.inspected[virtual_position] != '+':
-            return
-
-        self.position = virtual_position + 1
-        self.eat_whitespace()
-        self.quoted = self.quoted[:-1]
+        while True:
+            virtual_position = self.eat_virtual_whitespace(self.position + 1)
+            if virtual_position >= len(self.inspected) or self.inspected[virtual_position] != '+':
+                return
 
-        quote = self.get_quote()
-        self.position += 1
-        self.eat_long_quote(quote)
-        while not self.is_end_quote_making_allowance_for_unescaped_single_quote(quote):
-            self.eat_char_or_escaped_char(quote)
-        self.quoted += '"'
-        self.position += 1
-        self.eat_long_quote(quote)
+            self.position = virtual_position + 1
+            self.eat_whitespace()
 
-        self.eat_concatenated_strings()
+            quote = self.get_quote()
+            self.position += 1
+            self.eat_long_quote(quote)
+            self.eat_string_chars(quote)
+            self.position += 1
+            self.eat_long_quote(quote)
 
     def is_end_quote_making_allowance_for_unescaped_single_quote(self, quote):
         if quote != "'":
@@ -461,13 +2137,23 @@ class JsonParser:
             pass
         return self.check_quote(quote)
 
+    def eat_string_chars(self, quote):
+        while True:
+            self.eat_plain_string_chars()
+            if self.is_end_quote_making_allowance_for_unescaped_single_quote(quote):
+                return
+            self.eat_char_or_escaped_char(quote)
+
+    def eat_plain_string_chars(self):
+        end = PLAIN_STRING_REGEX.match(self.inspected, self.position).end()
+        if end > self.position:
+            self.quoted.append(self.inspected[self.position:end])
+            self.position = end
+
     def eat_virtual_whitespace(self, virtual_position):
         if virtual_position >= len(self.inspected):
             return virtual_position - 1
-        whitespace_regex = re.compile(r'\s')
-        while virtual_position < len(self.inspected) and whitespace_regex.match(self.inspected[virtual_position]):
-            virtual_position += 1
-        return virtual_position
+        return WHITESPACE_REGEX.match(self.inspected, virtual_position).end()
 
     def is_double_escaped_double_quote(self):
         if self.position + 2 >= len(self.inspected):
@@ -489,72 +2175,37 @@ class JsonParser:
         )
 
     def eat_char_or_escaped_char(self, quote):
-        if self.debug:
-            print('eat_char_or_escaped_char', self.position, self.inspected[self.position])
         if self.position >= len(self.inspected):
             raise JsonFixError('Unexpected end of quoted key or string')
-        if self.debug:
-            print(
-                'eatCharOrEscapedChar',
-                self.position,
-                self.inspected[self.position],
-                ' ' + str(ord(self.inspected[self.position])),
-            )
         if not self.check_quote(quote) and self.inspected[self.position] == '\\':
             if self.is_triple_escaped_double_quote():
-                self.log('eatCharOrEscapedChar triple escaped double quote')
                 self.position += 1
                 self.position += 1
             if self.is_double_escaped_double_quote():
-                self.log('eatCharOrEscapedChar double escaped double quote')
                 self.position += 1
             if (quote == "'" or quote == '`') and self.inspected[self.position + 1] == quote:
                 pass
             else:
-                self.quoted += self.inspected[self.position]
+                self.quoted.append(self.inspected[self.position])
             self.position += 1
         if (quote == "'" or quote == '`') and self.inspected[self.position] == '"':
-            self.quoted += '\\'
+            self.quoted.append('\\')
         if (self.inspected[self.position] == '\n'):
-            self.quoted += '\\n'
-            self.log('eatCharOrEscapedChar unescaped newline')
+            self.quoted.append('\\n')
         else:
-            self.quoted += self.inspected[self.position]
+            self.quoted.append(self.inspected[self.position])
         self.position += 1
 
     def eat_array(self):
-        if self.debug:
-            print('eat_array', self.position, self.inspected[self.position])
+        self.eat_open_bracket()
+        self.eat_nested_values(']')
+
+    def eat_open_bracket(self):
         if self.inspected[self.position] != '[':
             raise JsonFixError('Expected array')
-        self.quoted += self.inspected[self.position]
+        self.builder.start_array()
         self.position += 1
 
-        while True:
-            self.eat_whitespace()
-            self.eat_circular_optional()
-            if self.inspected[self.position] == ']':
-                self.remove_trailing_comma_if_present()
-                break
-            self.quoted_last_comma_position = None
-            self.eat_value()
-            self.eat_whitespace()
-
-            if self.inspected[self.position] == ',':
-                self.eat_comma()
-            elif self.inspected[self.position] != ']':
-                self.quoted += ', '
-
-        self.eat_close_bracket()
-
-    def remove_trailing_comma_if_present(self):
-        if self.quoted_last_comma_position:
-            self.quoted = (
-                self.quoted[:self.quoted_last_comma_position] +
-                self.quoted[self.quoted_last_comma_position + 2:]
-            )
-        self.quoted_last_comma_position = None
-
     def eat_circular_optional(self):
         if (
             self.inspected[self.position] == 'C' and
@@ -569,25 +2220,20 @@ class JsonParser:
             self.eat_circular()
 
     def eat_circular(self):
-        test_regex = re.compile(r'[Circular *\d]')
-        while test_regex.match(self.inspected[self.position]):
-            self.position += 1
-        self.quoted += '"Circular"'
+        self.set_checkpoint()
+        self.position = CIRCULAR_REGEX.match(self.inspected, self.position).end()
+        self.builder.string('"Circular"')
 
     def eat_comma(self):
-        if self.debug:
-            print('eat_comma', self.position, self.inspected[self.position])
         if self.inspected[self.position] != ',':
             raise JsonFixError('Expected comma')
-        self.quoted += self.inspected[self.position] + ' '
-        self.quoted_last_comma_position = len(self.quoted) - 2
         self.position += 1
         return True
 
     def eat_close_bracket(self):
         if self.inspected[self.position] != ']':
             raise JsonFixError('Expected close bracket')
-        self.quoted += self.inspected[self.position]
+        self.builder.end_array()
         self.position += 1
         return False
 
@@ -638,8 +2284,6 @@ class JsonParser:
 
     def eat_primitive(self):
         self.set_checkpoint()
-        if self.debug:
-            print('eatPrimitive', self.position, self.inspected[self.position])
 
         lower_char = self.inspected[self.position].lower()
         if lower_char == 'f' or lower_char == 't' or lower_char == 'n':
@@ -650,35 +2294,31 @@ class JsonParser:
             raise ValueError('Primitive not recognized, must start with f, t, n, or be numeric')
 
     def is_number_start_char(self, char):
-        return char and re.match(r'[\-0-9]', char)
+        return char in NUMBER_START_CHARS
 
     def eat_keyword(self):
         lower_substring = self.inspected[self.position:self.position + 5].lower()
 
         if lower_substring.startswith('false'):
-            self.log('eatFalse')
-            self.quoted += 'false'
             self.position += 5
+            self.builder.keyword('false')
         elif lower_substring.startswith('true'):
-            self.log('eatTrue')
-            self.quoted += 'true'
             self.position += 4
+            self.builder.keyword('true')
         elif lower_substring.startswith('none') or lower_substring.startswith('null'):
-            self.log('eatNull')
-            self.quoted += 'null'
             self.position += 4
+            self.builder.keyword('null')
         else:
             raise ValueError('Keyword not recognized, must be true, false, null or none')
 
     def eat_number(self):
-        number_str = ''
-
-        self.log('eatNumber')
+        end = NUMBER_REGEX.match(self.inspected, self.position).end()
+        number_str = self.inspected[self.position:end]
+        self.position = end
 
-        while self.is_number_char(self.inspected[self.position]):
-            number_str += self.inspected[self.position]
-            self.position += 1
+        self.builder.number(self.normalize_number(number_str))
 
+    def normalize_number(self, number_str):
         number_str = number_str.lower()
 
         check_str = number_str
@@ -700,12 +2340,781 @@ class JsonParser:
         if check_str.endswith('-') or check_str.endswith('+'):
             raise ValueError('Number cannot have trailing sign')
 
-        self.quoted += number_str
+        return number_str
 
     def is_number_char(self, char):
-        return char and re.match(r'[\-\+eE0-9.]', char)
-    
-    def log(self, message):
-        if self.debug:
-            print(message, self.position, self.inspected[self.position])
+        return char in NUMBER_CHARS
+
+
+class TracingJsonParser(JsonParser):
+    """A JsonParser that tells a tracer which repair rules fired, where and when.
+
+    The tracer is called as tracer(rule, position, seconds) with the position in the
+    text (in bytes for byte buffers) and the seconds since the parser was created.
+    Only the repairs of objects that were kept are reported, those made while trying
+    an open brace that turned out not to be the start of an object are dropped.
+    """
+
+    def __init__(self, input, tracer, limits=None, unstringify=True):
+        super().__init__(input, limits, unstringify)
+        self.tracer = tracer
+        self.started = time.perf_counter()
+        self.events = []
+
+    def trace(self, rule, position):
+        self.events.append((rule, position, time.perf_counter() - self.started))
+
+    def report(self, window_start=0):
+        events, self.events = self.events, []
+        if isinstance(self.source, Utf8Buffer):
+            # Positions are into the window decoded from the buffer at window_start
+            positions = sorted(set(position for _, position, _ in events))
+            offsets = dict(zip(positions, self.source.byte_offsets(self.inspected, positions)))
+            events = [(rule, window_start + offsets[position], seconds) for rule, position, seconds in events]
+        for rule, position, seconds in events:
+            self.tracer(rule, position, seconds)
+
+    def repair_json(self):
+        result = super().repair_json()
+        self.report()
+        return result
+
+    def repair_value(self):
+        result = super().repair_value()
+        self.report()
+        return result
+
+    def repair_edits(self):
+        result = super().repair_edits()
+        self.report()
+        return result
+
+    def repair_events(self, handler):
+        super().repair_events(handler)
+        self.report()
+
+    def extract_paths(self, paths):
+        result = super().extract_paths(paths)
+        self.report()
+        return result
+
+    def iter_json_matches(self, start=0):
+        for match in super().iter_json_matches(start):
+            self.report(match.start)
+            yield match
+
+    def iter_array_item_matches(self):
+        for match in super().iter_array_item_matches():
+            self.report(match.start)
+            yield match
+
+    def eat_object(self):
+        self.events = []
+        super().eat_object()
+
+    def eat_array_item(self):
+        self.events = []
+        return super().eat_array_item()
+
+    def eat_comma_after_value_optional(self, closers):
+        super().eat_comma_after_value_optional(closers)
+        if not closers or self.position >= len(self.inspected):
+            return
+        comma = self.inspected[self.position - 1] == ','
+        closing = self.inspected[self.eat_virtual_whitespace(self.position)] == closers[-1]
+        if comma and closing:
+            self.trace('trailing_comma_removed', self.position - 1)
+        elif not comma and not closing:
+            self.trace('comma_inserted', self.position)
+
+    def eat_quoted_key(self):
+        if self.get_quote() != '"':
+            self.trace('quote_converted', self.position)
+        super().eat_quoted_key()
+
+    def eat_extra_starting_key_double_quote(self, quote):
+        position = self.position
+        super().eat_extra_starting_key_double_quote(quote)
+        if self.position != position:
+            self.trace('extra_key_quote_removed', position)
+
+    def eat_unquoted_key(self):
+        position = self.position
+        super().eat_unquoted_key()
+        self.trace('key_quoted', position)
+
+    def eat_reference(self):
+        position = self.position
+        super().eat_reference()
+        self.trace('reference_removed', position)
+
+    def eat_string(self):
+        if self.get_quote() != '"':
+            self.trace('quote_converted', self.position)
+        super().eat_string()
+
+    def eat_concatenated_strings(self):
+        virtual_position = self.eat_virtual_whitespace(self.position + 1)
+        if virtual_position < len(self.inspected) and self.inspected[virtual_position] == '+':
+            self.trace('strings_concatenated', virtual_position)
+        super().eat_concatenated_strings()
+
+    def eat_char_or_escaped_char(self, quote):
+        super().eat_char_or_escaped_char(quote)
+        if self.inspected[self.position - 1] == '\n':
+            self.trace('newline_escaped', self.position - 1)
+
+    def eat_circular(self):
+        position = self.position
+        super().eat_circular()
+        self.trace('circular_replaced', position)
+
+    def eat_keyword(self):
+        position = self.position
+        super().eat_keyword()
+        if self.inspected[position:self.position] not in ('false', 'true', 'null'):
+            self.trace('keyword_converted', position)
+
+
+class LoggingTracer:
+    """A tracer that logs each repair rule that fires, to the fix_busted_json logger at DEBUG level unless told otherwise."""
+
+    def __init__(self, logger=None, level=None):
+        import logging
+        self.logger = logger or logging.getLogger('fix_busted_json')
+        self.level = logging.DEBUG if level is None else level
+
+    def __call__(self, rule, position, seconds):
+        self.logger.log(self.level, '%s at %d after %.6f s', rule, position, seconds)
+
+
+class StreamingJsonParser(JsonParser):
+    """Repairs a JSON object incrementally as it arrives in chunks, e.g. from an LLM token stream.
+
+    Only the unconsumed lookahead (a few characters) is carried over between calls to feed,
+    so each feed costs O(len(chunk)). snapshot returns the repaired document so far with any
+    open strings, arrays and objects virtually closed, and close returns the final result.
+    The parser acts as its own builder so that repaired text is emitted as soon as it is known.
+    """
+
+    def __init__(self):
+        super().__init__('')
+        self.builder = self
+        self.parts = []
+        self.quoted = self.parts
+        self.stack = []
+        self.state = 'start'
+        self.quote = None
+        self.number_str = ''
+        self.pending_comma = False
+        self.mark = 0
+        self.finished = False
+
+    def feed(self, chunk):
+        if self.state == 'done':
+            return
+        self.inspected = self.inspected[self.position:] + chunk
+        self.position = 0
+        self.run()
+
+    def close(self):
+        self.finished = True
+        self.run()
+        if self.state != 'done':
+            raise JsonFixError('Unexpected end of input')
+        return ''.join(self.parts)
+
+    def snapshot(self):
+        virtual = copy.copy(self)
+        virtual.builder = virtual
+        virtual.parts = virtual.quoted = list(self.parts)
+        virtual.stack = list(self.stack)
+        virtual.finished = True
+        try:
+            virtual.run()
+        except Exception:
+            virtual = self
+        return virtual.render()
+
+    def start_object(self):
+        self.quoted.append('{ ')
 
+    def end_object(self):
+        self.quoted.append(' }')
+
+    def start_array(self):
+        self.quoted.append('[')
+
+    def end_array(self):
+        self.quoted.append(']')
+
+    def key(self, text):
+        self.quoted.append(text)
+
+    def keyword(self, text):
+        self.quoted.append(text)
+
+    def run(self):
+        while self.state != 'done' and self.position < len(self.inspected):
+            if not getattr(self, 'step_' + self.state)():
+                break
+
+    def render(self):
+        if self.state == 'start':
+            return ''
+        parts = self.parts
+        tail = ''
+        if self.state in ('key_extra_quote', 'quoted_key', 'unquoted_key', 'colon', 'object_value', 'value'):
+            parts = parts[:self.mark]
+        elif self.state == 'string':
+            parts = [self.trim_partial_escape(''.join(parts))]
+            tail = '"'
+        elif self.state in ('string_end', 'concat'):
+            tail = '"'
+        elif self.state == 'number':
+            number_str = self.number_str.rstrip('.eE+-')
+            try:
+                tail = self.normalize_number(number_str) if number_str else ''
+            except ValueError:
+                tail = ''
+            if not tail:
+                parts = parts[:self.mark]
+        closers = ''.join(' }' if container == 'object' else ']' for container in reversed(self.stack))
+        return ''.join(parts) + tail + closers
+
+    def has_lookahead(self, count):
+        return self.finished or self.position + count <= len(self.inspected)
+
+    def skip_whitespace(self):
+        self.position = WHITESPACE_REGEX.match(self.inspected, self.position).end()
+        return self.position < len(self.inspected)
+
+    def begin_element(self):
+        self.mark = len(self.parts)
+        if self.pending_comma:
+            self.quoted.append(', ')
+            self.pending_comma = False
+
+    def close_container(self):
+        self.pending_comma = False
+        if self.stack.pop() == 'object':
+            self.eat_close_brace()
+        else:
+            self.eat_close_bracket()
+        self.state = 'after_value' if self.stack else 'done'
+
+    def step_start(self):
+        if not self.skip_whitespace():
+            return False
+        self.eat_open_brace()
+        self.stack.append('object')
+        self.state = 'key'
+        return True
+
+    def step_key(self):
+        if not self.skip_whitespace():
+            return False
+        char = self.inspected[self.position]
+        if char == '}':
+            self.close_container()
+            return True
+        if not self.has_lookahead(6 if char == '[' else 3 if char == '\\' else 1):
+            return False
+        self.begin_element()
+        quote = self.get_quote()
+        if quote:
+            self.quote = quote
+            self.quoted.append('"')
+            self.position += len(quote)
+            self.state = 'key_extra_quote' if quote == '"' else 'quoted_key'
+        elif char == '[':
+            self.eat_null_key()
+            self.state = 'colon'
+        else:
+            self.throw_if_json_special_character(char)
+            self.quoted.append('"')
+            self.state = 'unquoted_key'
+        return True
+
+    def step_key_extra_quote(self):
+        self.state = 'quoted_key'
+        if self.inspected[self.position] != '"':
+            return True
+        virtual_position = WHITESPACE_REGEX.match(self.inspected, self.position + 1).end()
+        if virtual_position >= len(self.inspected):
+            if not self.finished:
+                self.state = 'key_extra_quote'
+                return False
+        elif self.inspected[virtual_position] == ':':
+            return True
+        self.position += 1
+        return True
+
+    def step_quoted_key(self):
+        while True:
+            self.eat_plain_string_chars()
+            if self.position >= len(self.inspected) or not self.has_lookahead(4):
+                return False
+            if self.check_quote(self.quote):
+                self.quoted.append('"')
+                self.position += len(self.quote)
+                self.state = 'colon'
+                return True
+            self.eat_char_or_escaped_char(self.quote)
+
+    def step_unquoted_key(self):
+        while self.position < len(self.inspected):
+            char = self.inspected[self.position]
+            if char == ':' or char == ' ':
+                self.quoted.append('"')
+                self.state = 'colon'
+                return True
+            if char == '\\' and not self.has_lookahead(3):
+                return False
+            if self.get_quote():
+                raise JsonFixError('Unexpected quote in unquoted key')
+            self.quoted.append(char)
+            self.position += 1
+        return False
+
+    def step_colon(self):
+        if not self.skip_whitespace():
+            return False
+        self.eat_colon()
+        self.quoted.append(': ')
+        self.state = 'object_value'
+        return True
+
+    def step_object_value(self):
+        if not self.skip_whitespace():
+            return False
+        if self.inspected[self.position] == '<':
+            if not self.finished and self.inspected.find('>', self.position) == -1:
+                return False
+            self.eat_reference()
+        self.state = 'value'
+        return True
+
+    def step_value(self):
+        if not self.skip_whitespace():
+            return False
+        char = self.inspected[self.position]
+        if char == '\\' and not self.has_lookahead(3):
+            return False
+        if char == '{':
+            self.eat_open_brace()
+            self.stack.append('object')
+            self.state = 'key'
+        elif self.get_quote():
+            self.quote = self.get_quote()
+            self.quoted.append('"')
+            self.position += len(self.quote)
+            self.state = 'string'
+        elif char == '[':
+            self.start_array()
+            self.position += 1
+            self.stack.append('array')
+            self.state = 'array_item'
+        elif char.lower() in ('f', 't', 'n'):
+            if not self.has_lookahead(5):
+                return False
+            self.eat_keyword()
+            self.state = 'after_value'
+        elif self.is_number_start_char(char):
+            self.number_str = ''
+            self.state = 'number'
+        else:
+            raise ValueError('Primitive not recognized, must start with f, t, n, or be numeric')
+        return True
+
+    def step_string(self):
+        while True:
+            self.eat_plain_string_chars()
+            if self.position >= len(self.inspected) or not self.has_lookahead(4):
+                return False
+            if self.is_end_quote_making_allowance_for_unescaped_single_quote(self.quote):
+                self.position += len(self.quote)
+                self.state = 'string_end'
+                return True
+            self.eat_char_or_escaped_char(self.quote)
+
+    def step_string_end(self):
+        virtual_position = WHITESPACE_REGEX.match(self.inspected, self.position + 1).end()
+        if virtual_position >= len(self.inspected):
+            if not self.finished:
+                return False
+        elif self.inspected[virtual_position] == '+':
+            self.position = virtual_position + 1
+            self.state = 'concat'
+            return True
+        self.quoted.append('"')
+        self.state = 'after_value'
+        return True
+
+    def step_concat(self):
+        if not self.skip_whitespace():
+            return False
+        if self.inspected[self.position] == '\\' and not self.has_lookahead(3):
+            return False
+        quote = self.get_quote()
+        if not quote:
+            raise JsonFixError('Expected quote after +')
+        self.quote = quote
+        self.position += len(quote)
+        self.state = 'string'
+        return True
+
+    def step_number(self):
+        end = NUMBER_REGEX.match(self.inspected, self.position).end()
+        self.number_str += self.inspected[self.position:end]
+        self.position = end
+        if self.position >= len(self.inspected):
+            return False
+        self.quoted.append(self.normalize_number(self.number_str))
+        self.state = 'after_value'
+        return True
+
+    def step_array_item(self):
+        if not self.skip_whitespace():
+            return False
+        if self.inspected[self.position] == ']':
+            self.close_container()
+            return True
+        if self.inspected[self.position] == 'C':
+            if self.inspected.startswith('Circular', self.position):
+                self.begin_element()
+                self.quoted.append('"Circular"')
+                self.state = 'circular'
+                return True
+            if not self.finished and 'Circular'.startswith(self.inspected[self.position:]):
+                return False
+        self.begin_element()
+        self.state = 'value'
+        return True
+
+    def step_circular(self):
+        self.position = CIRCULAR_REGEX.match(self.inspected, self.position).end()
+        if self.position >= len(self.inspected):
+            return False
+        self.state = 'after_value'
+        return True
+
+    def step_after_value(self):
+        if not self.skip_whitespace():
+            return False
+        char = self.inspected[self.position]
+        if self.stack[-1] == 'object':
+            closer = '}'
+            self.state = 'key'
+        else:
+            closer = ']'
+            self.state = 'array_item'
+        if char == ',':
+            self.position += 1
+            self.pending_comma = True
+        elif char != closer:
+            self.pending_comma = True
+        return True
+
+    def trim_partial_escape(self, text):
+        backslash = text.rfind('\\', max(0, len(text) - 6))
+        if backslash == -1 or not re.fullmatch(r'\\(u[0-9a-fA-F]{0,3})?', text[backslash:]):
+            return text
+        escapes = len(text[:backslash + 1]) - len(text[:backslash + 1].rstrip('\\'))
+        if escapes % 2 == 0:
+            return text
+        return text[:backslash]
+
+
+class JsonLogIndex:
+    """Finds the JSON objects in a log file once, and keeps where they are in a sidecar file.
+
+    For each object the index has its offset and length in the log in bytes, the length
+    of the repaired JSON, and the set of top-level keys, or -1 if it did not repair to
+    valid JSON. Queries bring the index up to date first, scanning only what has been
+    appended to the log since it was last indexed, and then only read and repair the
+    spans of the log that they need.
+
+    An index is not to be shared between threads, each thread should open its own.
+    """
+
+    VERSION = 1
+    SIGNATURE_LENGTH = 1024
+
+    def __init__(self, path, index_path=None, limits=None):
+        self.path = path
+        self.index_path = index_path or path + '.jsonindex'
+        self.limits = limits
+        self.loaded = False
+        self.clear()
+
+    def clear(self):
+        self.offsets = array.array('q')
+        self.lengths = array.array('q')
+        self.text_lengths = array.array('q')
+        self.keysets = array.array('q')
+        self.keyset_ids = {}
+        self.scanned = 0
+        self.resume = 0
+        self.signature = [0, 0]
+
+    def __len__(self):
+        self.update()
+        return len(self.offsets)
+
+    def update(self):
+        if not self.loaded:
+            self.load()
+            self.loaded = True
+        with open(self.path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < self.scanned or self.read_signature(file, self.signature[0]) != self.signature:
+                # The log was replaced or truncated, e.g. by log rotation
+                self.clear()
+            if size == self.scanned:
+                return self
+            self.signature = self.read_signature(file, min(size, self.SIGNATURE_LENGTH))
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                self.scan(buffer)
+        self.scanned = size
+        self.save()
+        return self
+
+    def scan(self, buffer):
+        # The objects found after the first one that ran into the end of the log are
+        # only provisional, as that one may contain them once the rest of it is written
+        while self.offsets and self.offsets[-1] >= self.resume:
+            for column in (self.offsets, self.lengths, self.text_lengths, self.keysets):
+                column.pop()
+        parser = self.log_parser(buffer)
+        for match in parser.iter_json_matches(self.resume):
+            self.offsets.append(match.start)
+            self.lengths.append(match.end - match.start)
+            self.text_lengths.append(len(match.text))
+            self.keysets.append(self.keyset_id(match))
+        if parser.incomplete_position is None:
+            self.resume = len(buffer)
+        else:
+            self.resume = parser.incomplete_position
+
+    def keyset_id(self, match):
+        if not match.is_valid():
+            return -1
+        try:
+            keys = tuple(match.value)
+        except Exception:
+            keys = ()
+        return self.keyset_ids.setdefault(keys, len(self.keyset_ids))
+
+    def log_parser(self, buffer):
+        # A log is never stringified JSON, so always search the bytes as they are
+        return new_parser(buffer, self.limits, unstringify=False)
+
+    def read_signature(self, file, length):
+        file.seek(0)
+        return [length, zlib.crc32(file.read(length))]
+
+    def load(self):
+        # A line of JSON with the state of the index, then the columns as arrays of int64
+        try:
+            with open(self.index_path, 'rb') as file:
+                header = json.loads(file.readline())
+                if header['version'] != self.VERSION or header['byteorder'] != sys.byteorder:
+                    return
+                columns = []
+                for _ in range(4):
+                    column = array.array('q')
+                    column.fromfile(file, header['count'])
+                    columns.append(column)
+        except (OSError, ValueError, KeyError, EOFError):
+            return
+        self.offsets, self.lengths, self.text_lengths, self.keysets = columns
+        self.keyset_ids = {tuple(keys): i for i, keys in enumerate(header['keysets'])}
+        self.scanned = header['scanned']
+        self.resume = header['resume']
+        self.signature = header['signature']
+
+    def save(self):
+        header = {
+            'version': self.VERSION,
+            'byteorder': sys.byteorder,
+            'count': len(self.offsets),
+            'scanned': self.scanned,
+            'resume': self.resume,
+            'signature': self.signature,
+            'keysets': [list(keys) for keys in self.keyset_ids],
+        }
+        # Each thread writes its own temporary file, so indexes of the same log in
+        # different threads or processes cannot write over each other's
+        temporary_path = f'{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(json.dumps(header).encode('utf-8') + b'\n')
+            for column in (self.offsets, self.lengths, self.text_lengths, self.keysets):
+                column.tofile(file)
+        os.replace(temporary_path, self.index_path)
+
+    def iter_json_matches(self, entries=None):
+        # entries are positions in the index, all of them if not given
+        self.update()
+        if entries is None:
+            entries = range(len(self.offsets))
+        with open(self.path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                # Each object is repaired from its offset in the log, just as the scan
+                # that indexed it did, so only the windows of the log it is in are read
+                parser = self.log_parser(buffer)
+                for i in entries:
+                    offset = self.offsets[i]
+                    match = next(parser.iter_json_matches(offset), None)
+                    if match is None or match.start != offset:
+                        raise JsonFixError(f'The log changed at offset {offset} since it was indexed')
+                    yield match
+
+    def valid_entries(self, keys=()):
+        keysets = list(self.keyset_ids)
+        matching_keysets = {i for i, keyset in enumerate(keysets) if all(key in keyset for key in keys)}
+        return [i for i, keyset in enumerate(self.keysets) if keyset in matching_keysets]
+
+    def first_json(self):
+        self.update()
+        return self.repaired_text(self.valid_entries()[:1])
+
+    def last_json(self):
+        self.update()
+        return self.repaired_text(self.valid_entries()[-1:])
+
+    def largest_json(self):
+        self.update()
+        entries = self.valid_entries()
+        if not entries:
+            return ""
+        largest = max(entries, key=lambda i: (self.text_lengths[i], -i))
+        return self.repaired_text([largest])
+
+    def json_matching(self, regex, keys=()):
+        # keys narrows the search down to objects that have all of them at the top level,
+        # without reading the other objects from the log
+        self.update()
+        for match in self.iter_json_matches(self.valid_entries(keys)):
+            if regex.search(match.text):
+                return match.text
+        return ""
+
+    def repaired_text(self, entries):
+        for match in self.iter_json_matches(entries):
+            return match.text
+        return ""
+
+    def to_array_of_plain_strings_or_json(self):
+        self.update()
+        with open(self.path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                parser = self.log_parser(buffer)
+                return list(parser.iter_plain_strings_or_json(self.iter_json_matches()))
+
+    def log_jsons(self, file=None, max_depth=EMBEDDED_JSON_DEPTH):
+        log_plain_strings_or_json(self.to_array_of_plain_strings_or_json(), file, max_depth)
+
+
+def log_jsons_to_string(text):
+    output = io.StringIO()
+    log_jsons(text, output)
+    return output.getvalue()
+
+def list_jsons(text):
+    return list(iter_jsons(text))
+
+COMMAND_LINE_MODES = {
+    'repair': repair_json,
+    'all': list_jsons,
+    'first': first_json,
+    'last': last_json,
+    'largest': largest_json,
+    'log': log_jsons_to_string,
+}
+
+def read_inputs(files, whole):
+    # Reading a line at a time keeps memory bounded however large the input is
+    for name in files or ['-']:
+        if name == '-':
+            name = '<stdin>'
+            file = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='replace')
+        else:
+            file = open(name, encoding='utf-8', errors='replace')
+        with file:
+            if whole:
+                yield name, file.read()
+                continue
+            for number, line in enumerate(file, 1):
+                line = line.rstrip('\r\n')
+                if line.strip():
+                    yield f'{name}:{number}', line
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='fix-busted-json',
+        description='Repairs broken JSON, or finds JSON objects in text, writing one JSON object per line.',
+    )
+    parser.add_argument('files', nargs='*', help='files to read, standard input if none are given')
+    parser.add_argument(
+        '-m', '--mode', choices=list(COMMAND_LINE_MODES), default='repair',
+        help='repair each input, or output all, the first, the last or the largest JSON object found, '
+        'or log the text with the JSON objects in it pretty printed (default: repair)',
+    )
+    parser.add_argument(
+        '-w', '--whole', action='store_true',
+        help='treat each file as a single input instead of each line being a separate input',
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='number of worker processes, 0 for one per core (default: 1)',
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 0:
+        parser.error('argument -j/--jobs: must be 0 or more')
+
+    inputs, locations = itertools.tee(read_inputs(args.files, args.whole))
+    texts = (text for location, text in inputs)
+    results = map_many(COMMAND_LINE_MODES[args.mode], texts, args.jobs or None)
+    output = sys.stdout
+    status = 0
+    found = ''
+    try:
+        for (location, text), result in zip(locations, results):
+            if isinstance(result, Exception):
+                # The text of the exception comes from wherever in the engine it failed, so
+                # is no use to the user and would change whenever the engine does
+                print(f'{location}: could not repair JSON', file=sys.stderr)
+                status = 1
+            elif args.mode == 'repair':
+                output.write(result + '\n')
+            elif args.mode == 'all':
+                for item in result:
+                    output.write(item + '\n')
+            elif args.mode == 'first':
+                if result:
+                    found = result
+                    break
+            elif args.mode == 'last':
+                found = result or found
+            elif args.mode == 'largest':
+                if len(result) > len(found):
+                    found = result
+            else:
+                output.write(result)
+        if found:
+            output.write(found + '\n')
+        output.flush()
+    except BrokenPipeError:
+        # The reader went away, e.g. piped into head, so there is nobody left to tell
+        sys.stdout = None
+        return 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,28 @@
 
 import unittest
 from fix_busted_json import repair_json, to_array_of_plain_strings_or_json, first_json, last_json, largest_json, json_matching
+from fix_busted_json import StreamingJsonParser, JsonFixError, repair_to_object, iter_jsons
+from fix_busted_json import iter_json_matches, JsonMatch
+from fix_busted_json import repair_many, first_json_many, to_array_of_plain_strings_or_json_many
+from fix_busted_json import arepair_json, afirst_json, aiter_jsons, JsonLogIndex
+from fix_busted_json import enable_cache, disable_cache, enable_tracing, disable_tracing, LoggingTracer
+from fix_busted_json import repair_edits, apply_json_edits, write_json_edits, iter_array_items, can_parse_json
+from fix_busted_json import repair_events, JsonHandler, expand_embedded_json, log_jsons, extract_paths
+from fix_busted_json import JsonLimits, JsonLimitError, JsonDepthLimitError, JsonInputLimitError, JsonOutputLimitError
+from fix_busted_json import JsonAttemptLimitError, JsonStepLimitError, JsonTimeLimitError
+import fix_busted_json
+import asyncio
+import concurrent.futures
+import contextlib
+import io
 import json
+import mmap
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
 import re
 
 class TestParseJson(unittest.TestCase):
@@ -557,6 +578,621 @@ class TestParseJson(unittest.TestCase):
         self.assertEqual(result, '{ "res": "{ \\"a\\": \\"b\\" }" }')
         self.assertTrue(self.assert_is_json(result))
 
+    def test_streaming_parser_gives_same_result_as_repair_json(self):
+        input_object = "{ name: 'John' 'age': 30, 'city': 'New' + ' York', tags: [1, 2, 3,], }"
+        parser = StreamingJsonParser()
+        for char in input_object:
+            parser.feed(char)
+        self.assertEqual(parser.close(), repair_json(input_object))
+
+    def test_streaming_parser_snapshot_closes_open_strings_arrays_and_objects(self):
+        parser = StreamingJsonParser()
+        parser.feed('{ action: "Search", input: { query: "developer jo')
+        self.assertEqual(parser.snapshot(), '{ "action": "Search", "input": { "query": "developer jo" } }')
+        parser.feed('bs", tags: [1, 2')
+        self.assertEqual(parser.snapshot(), '{ "action": "Search", "input": { "query": "developer jobs", "tags": [1, 2] } }')
+
+    def test_streaming_parser_snapshot_drops_incomplete_key(self):
+        parser = StreamingJsonParser()
+        parser.feed('{ "a": 1, "b')
+        self.assertEqual(parser.snapshot(), '{ "a": 1 }')
+        parser.feed('": ')
+        self.assertEqual(parser.snapshot(), '{ "a": 1 }')
+
+    def test_streaming_parser_snapshot_is_valid_json_for_every_prefix(self):
+        input_object = '{"res": "a \\u00e9 \\"b\\"", \'list\': [True, None, -1.5e+3, {x: `y`}], z: [Circular *1]}'
+        parser = StreamingJsonParser()
+        for char in input_object:
+            parser.feed(char)
+            self.assertTrue(self.assert_is_json(parser.snapshot()) or parser.snapshot() == '')
+        self.assertEqual(parser.close(), repair_json(input_object))
+
+    def test_streaming_parser_close_throws_on_incomplete_input(self):
+        parser = StreamingJsonParser()
+        parser.feed('{ "a": [1, 2')
+        with self.assertRaises(JsonFixError):
+            parser.close()
+
+    def test_repair_to_object_builds_python_objects(self):
+        input_object = "{ name: 'John' 'age': 30, 'city': 'New' + ' York', 'tags': ['a', True, None, -1.5e3,], }"
+        result = repair_to_object(input_object)
+        expected = {'name': 'John', 'age': 30, 'city': 'New York', 'tags': ['a', True, None, -1500.0]}
+        self.assertEqual(result, expected)
+
+    def test_repair_to_object_matches_json_loads_of_repair_json(self):
+        input_object = '{\\"@metadata\\":{\\"message\\":\\"{\\\\"url\\\\": \\\\"hey\\\\"}\\"}}'
+        result = repair_to_object(input_object)
+        self.assertEqual(result, json.loads(repair_json(input_object)))
+        self.assertEqual(result, {'@metadata': {'message': '{"url": "hey"}'}})
+
+    def test_repair_to_object_copes_with_circular_references_and_null_keys(self):
+        input_object = "{ [null]: 'test', abc: <ref *1> { xyz: [Circular *1] } }"
+        result = repair_to_object(input_object)
+        self.assertEqual(result, {'null': 'test', 'abc': {'xyz': ['Circular']}})
+
+    def test_repair_to_object_throws_on_broken_json(self):
+        with self.assertRaises(ValueError):
+            repair_to_object('{ test: postgres }')
+
+    def test_should_concatenate_thousands_of_strings(self):
+        input_object = '{ "abc": ' + ' + '.join(["'x'"] * 5000) + ', "def": [1,2,3,], }'
+        result = repair_json(input_object)
+        expected = '{ "abc": "' + 'x' * 5000 + '", "def": [1, 2, 3] }'
+        self.assertEqual(result, expected)
+
+    def test_should_return_valid_json_normalized_without_repair(self):
+        input_object = '{"a":[1,2.5E3,{"b":{}}],"c" : "x, y: {z}","d":true}'
+        result = repair_json(input_object)
+        expected = '{ "a": [1, 2.5e3, { "b": {  } }], "c": "x, y: {z}", "d": true }'
+        self.assertEqual(result, expected)
+
+    def test_should_not_break_valid_json_with_escaped_backslash_before_closing_quote(self):
+        input_object = '{"path": "C:\\\\", "b": 1}'
+        result = repair_json(input_object)
+        self.assertEqual(result, '{ "path": "C:\\\\", "b": 1 }')
+        self.assertEqual(repair_to_object(input_object), {'path': 'C:\\', 'b': 1})
+
+    def test_should_not_take_nan_or_infinity_as_valid_json(self):
+        # json accepts these, but they are not JSON, so they are left for the repair engine
+        for input_object, error in [
+            ('{"a": NaN}', ValueError),
+            ('{"a": Infinity}', ValueError),
+            ('{"a": -Infinity}', IndexError),
+            ('"{\\"a\\": NaN}"', ValueError),
+        ]:
+            with self.assertRaises(error):
+                repair_json(input_object)
+            with self.assertRaises(ValueError):
+                repair_to_object(input_object)
+
+    def test_should_cope_with_very_deeply_nested_input(self):
+        depth = 20000
+        input_object = '{ a: ' + "[{ b: 'x', c: " * depth + '1' + ' }]' * depth + ' }'
+        result = repair_json(input_object)
+        expected = '{ "a": ' + '[{ "b": "x", "c": ' * depth + '1' + ' }]' * depth + ' }'
+        self.assertEqual(result, expected)
+
+    def test_should_find_json_after_many_unclosed_braces(self):
+        input_object = 'log start ' + '{ a: ' * 20000 + ' end of log { ok: 1 } done'
+        result = to_array_of_plain_strings_or_json(input_object)
+        self.assertEqual(result[-2:], ['{ "ok": 1 }', ' done'])
+        self.assertEqual(first_json(input_object), '{ "ok": 1 }')
+        self.assertEqual(last_json(input_object), '{ "ok": 1 }')
+
+    def test_should_not_rescan_unclosed_keys_and_strings_for_every_brace(self):
+        # Every open brace here starts a key or string that runs to the end of the text
+        for input_object in ['\\{' * 8000, '{a' * 40000, "{b:'s" * 8000]:
+            for text in (input_object, input_object.encode()):
+                start = time.perf_counter()
+                result = to_array_of_plain_strings_or_json(text)
+                self.assertLess(time.perf_counter() - start, 5)
+                self.assertEqual(''.join(result), input_object)
+
+    def test_should_not_reparse_members_of_failed_objects_for_every_brace(self):
+        # Every open brace here starts an object whose members alternate keys and
+        # strings up to the end of the text
+        input_object = "{x:'y}{" * 8000
+        for text in (input_object, input_object.encode()):
+            start = time.perf_counter()
+            result = to_array_of_plain_strings_or_json(text)
+            self.assertLess(time.perf_counter() - start, 5)
+            self.assertEqual(''.join(result), input_object)
+
+    def test_iter_jsons_yields_repaired_json_objects(self):
+        input = "text { gday: 'hi' } before { test: 'test' } text { broken after"
+        result = iter_jsons(input)
+        self.assertEqual(next(result), '{ "gday": "hi" }')
+        self.assertEqual(list(result), ['{ "test": "test" }'])
+
+    def test_iter_jsons_can_include_plain_text(self):
+        input = "text before { test: 'test', array: ['test', { test: 'test' }] } text { after"
+        result = list(iter_jsons(input, include_plain_text=True))
+        self.assertEqual(result, to_array_of_plain_strings_or_json(input))
+        self.assertEqual(result[-2:], ['{', ' after'])
+
+    def test_iter_json_matches_gives_spans_text_and_value(self):
+        input = "text { gday: 'hi' } etc { test: [1, 2] } end"
+        matches = list(iter_json_matches(input))
+        self.assertEqual([(match.start, match.end) for match in matches], [(5, 19), (24, 40)])
+        self.assertEqual(input[matches[1].start:matches[1].end], "{ test: [1, 2] }")
+        self.assertEqual(matches[1].text, '{ "test": [1, 2] }')
+        self.assertEqual(matches[1].value, {'test': [1, 2]})
+
+    def test_json_match_value_is_decoded_once(self):
+        match = JsonMatch(0, 14, '{ "a": [1] }')
+        self.assertIs(match.value, match.value)
+        self.assertTrue(match.is_valid())
+
+    def test_json_match_value_of_json_too_deep_for_json_to_decode(self):
+        match = next(iter_json_matches('text ' + '{ "a": ' * 100000 + '1' + ' }' * 100000))
+        value = match.value
+        for _ in range(100000):
+            value = value['a']
+        self.assertEqual(value, 1)
+
+    def test_last_json_of_long_log(self):
+        log = ''.join(f"line {i} {{ id: {i}, msg: 'hello' }} text\n" for i in range(5000))
+        self.assertEqual(last_json(log), '{ "id": 4999, "msg": "hello" }')
+        self.assertEqual(last_json(log + "{ broken: "), '{ "id": 4999, "msg": "hello" }')
+
+    def test_last_json_when_last_object_is_larger_than_the_end_scanned_first(self):
+        inner = ', '.join(f"k{i}: {{ id: {i} }}" for i in range(10000))
+        input = "{ first: 1 } text { outer: { " + inner + " } } text"
+        self.assertTrue(last_json(input).startswith('{ "outer": { "k0": { "id": 0 }'))
+        self.assertTrue(len(input) > 65536)
+
+    def test_repair_many_keeps_order_and_reports_errors(self):
+        inputs = ["{ a: 1 }", "{ broken", "{ b: 'x' }"] * 5
+        results = list(repair_many(inputs, workers=2, chunksize=2))
+        self.assertEqual(len(results), 15)
+        self.assertEqual(results[12], '{ "a": 1 }')
+        self.assertIsInstance(results[13], Exception)
+        self.assertEqual(results[14], '{ "b": "x" }')
+
+    def test_first_json_many_and_to_array_many(self):
+        inputs = ["text { a: 1 } text", "no json here"]
+        self.assertEqual(list(first_json_many(inputs, workers=1)), ['{ "a": 1 }', ''])
+        self.assertEqual(
+            list(to_array_of_plain_strings_or_json_many(inputs, workers=2)),
+            [['text ', '{ "a": 1 }', ' text'], ['no json here']],
+        )
+
+    def run_async(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    async def chunks(self, text, size):
+        for start in range(0, len(text), size):
+            await asyncio.sleep(0)
+            yield text[start:start + size]
+
+    def test_arepair_json(self):
+        input = "{ name: 'John' 'age': 30, 'city': 'New' + ' York', }"
+        expected = '{ "name": "John", "age": 30, "city": "New York" }'
+        self.assertEqual(self.run_async(arepair_json(input)), expected)
+        self.assertEqual(self.run_async(arepair_json(input, yield_every=4)), expected)
+        self.assertEqual(self.run_async(arepair_json(self.chunks(input, 3))), expected)
+        self.assertEqual(self.run_async(arepair_json('{"a":  [1, 2]}', yield_every=4)), '{ "a": [1, 2] }')
+        # Bytes, given whole or in chunks that can split a character
+        self.assertEqual(self.run_async(arepair_json(b'{ a: 1 }', yield_every=4)), '{ "a": 1 }')
+        encoded = "{ name: 'Zoë' }".encode('utf-8')
+        for yield_every in (None, 2):
+            self.assertEqual(self.run_async(arepair_json(self.chunks(encoded, 1), yield_every=yield_every)), '{ "name": "Zoë" }')
+        # Every mode gives what repair_json gives, for arrays, primitives and stringified JSON too
+        for input, expected in [('[1, 2 3]', '[1, 2, 3]'), ('True', 'true'), ('"{\\"a\\": 1}"', '{ "a": 1 }'),
+                                ('{"path": "C:\\\\"}', '{ "path": "C:\\\\" }')]:
+            self.assertEqual(self.run_async(arepair_json(input, yield_every=2)), expected)
+            self.assertEqual(self.run_async(arepair_json(self.chunks(input, 3))), expected)
+        # Valid JSON is checked and normalized a slice at a time too, giving other tasks turns
+        document = json.dumps({'items': [{'id': i, 'tags': ['a', 'b'], 'path': 'C:\\'} for i in range(2000)]})
+
+        async def count_turns(coroutine):
+            turns = []
+            task = asyncio.ensure_future(coroutine)
+            while not task.done():
+                turns.append(None)
+                await asyncio.sleep(0)
+            return len(turns), task.result()
+
+        for input in (document, self.chunks(document, 10000)):
+            turns, result = self.run_async(count_turns(arepair_json(input, yield_every=1000)))
+            self.assertEqual(result, repair_json(document))
+            self.assertGreater(turns, 50)
+
+    def test_afirst_json_and_aiter_jsons(self):
+        input = "text { first: 123 } etc { second_example: 456 }"
+        self.assertEqual(self.run_async(afirst_json(self.chunks(input, 5))), '{ "first": 123 }')
+        self.assertEqual(self.run_async(afirst_json(self.chunks(input.encode('utf-8'), 5))), '{ "first": 123 }')
+
+        async def collect():
+            return [item async for item in aiter_jsons(input)]
+
+        self.assertEqual(self.run_async(collect()), ['{ "first": 123 }', '{ "second_example": 456 }'])
+
+    def run_command_line(self, text, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'input.txt')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(text)
+            output = io.StringIO()
+            errors = io.StringIO()
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+                status = fix_busted_json.main([path, *args])
+            return status, output.getvalue(), errors.getvalue().replace(path, 'input.txt')
+
+    def test_command_line_repairs_each_line(self):
+        status, output, errors = self.run_command_line("{ a: 1 }\n{ broken\n\n{ b: 'x' }\n")
+        self.assertEqual(status, 1)
+        self.assertEqual(output, '{ "a": 1 }\n{ "b": "x" }\n')
+        self.assertEqual(errors, 'input.txt:2: could not repair JSON\n')
+
+    def test_command_line_finds_json_in_text(self):
+        text = "log { a: 1 } and { b: 'x' }\nmore { c: [1, 2] }\n"
+        self.assertEqual(self.run_command_line(text, '-m', 'all', '-j', '2')[1], '{ "a": 1 }\n{ "b": "x" }\n{ "c": [1, 2] }\n')
+        self.assertEqual(self.run_command_line(text, '-m', 'first')[1], '{ "a": 1 }\n')
+        self.assertEqual(self.run_command_line(text, '-m', 'last')[1], '{ "c": [1, 2] }\n')
+        self.assertEqual(self.run_command_line(text, '-m', 'largest', '-w')[1], '{ "c": [1, 2] }\n')
+
+    def test_command_line_rejects_a_negative_number_of_jobs(self):
+        with self.assertRaises(SystemExit) as context:
+            self.run_command_line("{ a: 1 }\n", '-j', '-1')
+        self.assertEqual(context.exception.code, 2)
+
+    def test_finds_json_in_bytes(self):
+        input = "tëxt { a: 'ü' } etc { b: [1, 2] } end"
+        for buffer in [input.encode(), bytearray(input.encode()), memoryview(input.encode())]:
+            self.assertEqual(to_array_of_plain_strings_or_json(buffer), to_array_of_plain_strings_or_json(input))
+            self.assertEqual(last_json(buffer), '{ "b": [1, 2] }')
+        matches = list(iter_json_matches(input.encode()))
+        self.assertEqual([(match.start, match.end) for match in matches], [(6, 17), (22, 35)])
+        self.assertEqual(input.encode()[6:17].decode(), "{ a: 'ü' }")
+        self.assertEqual(repair_json(b"{ a: 'b' }"), '{ "a": "b" }')
+
+    def test_finds_json_in_bytes_that_looks_past_the_first_window(self):
+        input = 'log {""' + ' ' * 600 + ': 1} end'
+        self.assertEqual(first_json(input), '{ "": 1 }')
+        self.assertEqual(first_json(input.encode()), '{ "": 1 }')
+
+    def test_finds_json_in_mmap(self):
+        with tempfile.TemporaryFile() as file:
+            file.write(b"log line { a: 1 }\n" * 1000 + b"last { big: [" + b"1, " * 1000 + b"2] }\n")
+            file.flush()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                self.assertEqual(first_json(buffer), '{ "a": 1 }')
+                self.assertEqual(largest_json(buffer), '{ "big": [' + '1, ' * 1000 + '2] }')
+
+    def test_json_log_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'app.log')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write("start { a: 1 } then { action: 'go', b: [1, 2, 3] }\nlast { outer: [ { inner: 1 }")
+            index = JsonLogIndex(path)
+            self.assertEqual(index.first_json(), '{ "a": 1 }')
+            self.assertEqual(index.last_json(), '{ "inner": 1 }')
+            self.assertEqual(index.largest_json(), '{ "action": "go", "b": [1, 2, 3] }')
+            self.assertEqual(index.json_matching(re.compile('go'), keys=['action']), '{ "action": "go", "b": [1, 2, 3] }')
+            self.assertEqual(index.json_matching(re.compile('go'), keys=['a']), '')
+            self.assertTrue(os.path.exists(path + '.jsonindex'))
+
+            with open(path, 'a', encoding='utf-8') as file:
+                file.write(" ] } end")
+            index = JsonLogIndex(path)
+            self.assertEqual(index.last_json(), '{ "outer": [{ "inner": 1 }] }')
+            self.assertEqual(len(index), 3)
+            with open(path, encoding='utf-8') as file:
+                self.assertEqual(index.to_array_of_plain_strings_or_json(), to_array_of_plain_strings_or_json(file.read()))
+
+    def test_json_log_index_is_traced_and_limited(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'app.log')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write("é { a: 1 } then { b: [[1]] }")
+            events = []
+            enable_tracing(lambda rule, position, seconds: events.append((rule, position)))
+            try:
+                self.assertEqual(JsonLogIndex(path).first_json(), '{ "a": 1 }')
+            finally:
+                disable_tracing()
+            # Positions are in bytes in the log, for the scan and for the repair of the first object
+            self.assertEqual(events, [('key_quoted', 5), ('key_quoted', 19), ('key_quoted', 5)])
+            os.remove(path + '.jsonindex')
+            with self.assertRaises(JsonDepthLimitError):
+                JsonLogIndex(path, limits=JsonLimits(max_depth=2)).first_json()
+
+    def test_cache_counts_hits_and_misses(self):
+        cache = enable_cache()
+        try:
+            input = "{ name: 'John' }"
+            self.assertEqual(repair_json(input), '{ "name": "John" }')
+            self.assertEqual(repair_json(input), '{ "name": "John" }')
+            self.assertEqual(json_matching("a { b: 1 }", re.compile("b")), '{ "b": 1 }')
+            self.assertEqual(json_matching("a { b: 1 }", re.compile("c")), '')
+            self.assertEqual((cache.hits, cache.misses), (1, 3))
+            errors = []
+            for _ in range(2):
+                with self.assertRaises(IndexError) as raised:
+                    repair_json("{ broken")
+                errors.append(raised.exception)
+            self.assertIs(errors[0], errors[1])
+            self.assertEqual((cache.hits, cache.misses), (2, 4))
+            # Options given by name share the entry of options given by position
+            self.assertEqual(json_matching("a { b: 1 }", regex=re.compile("b")), '{ "b": 1 }')
+            self.assertEqual(repair_json(input, limits=None), '{ "name": "John" }')
+            self.assertEqual((cache.hits, cache.misses), (4, 4))
+        finally:
+            disable_cache()
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = enable_cache(max_entries=2)
+        try:
+            repair_json("{ a: 1 }")
+            repair_json("{ b: 2 }")
+            repair_json("{ a: 1 }")
+            repair_json("{ c: 3 }")
+            self.assertEqual(len(cache), 2)
+            repair_json("{ a: 1 }")
+            self.assertEqual(cache.hits, 2)
+            repair_json("{ b: 2 }")
+            self.assertEqual(cache.misses, 4)
+            enable_cache(max_bytes=0)
+            repair_json("{ a: 1 }")
+            self.assertEqual(len(fix_busted_json.repair_cache), 0)
+        finally:
+            disable_cache()
+
+    def test_tracer_is_told_which_repairs_were_made(self):
+        events = []
+        enable_tracing(lambda rule, position, seconds: events.append((rule, position)))
+        try:
+            repair_json("{ name: 'John' 'age': 30, 'city': 'New' + ' York', valid: True, }")
+            self.assertEqual(events, [
+                ('key_quoted', 2),
+                ('quote_converted', 8),
+                ('comma_inserted', 15),
+                ('quote_converted', 15),
+                ('quote_converted', 26),
+                ('quote_converted', 34),
+                ('strings_concatenated', 40),
+                ('key_quoted', 51),
+                ('keyword_converted', 58),
+                ('trailing_comma_removed', 62),
+            ])
+            events.clear()
+            to_array_of_plain_strings_or_json("é { broken: 'x { a: [Circular *1] }".encode('utf-8'))
+            self.assertEqual(events, [('key_quoted', 18), ('circular_replaced', 22)])
+            events.clear()
+            enable_tracing(lambda *event: events.append(event), sample_rate=0)
+            repair_json("{ a: 1 }")
+            self.assertEqual(events, [])
+        finally:
+            disable_tracing()
+
+    def test_logging_tracer(self):
+        enable_tracing(LoggingTracer())
+        try:
+            with self.assertLogs('fix_busted_json', level='DEBUG') as logs:
+                repair_json("{ a: 1 }")
+            self.assertEqual(len(logs.output), 1)
+            self.assertTrue(logs.output[0].startswith('DEBUG:fix_busted_json:key_quoted at 2 after '))
+        finally:
+            disable_tracing()
+
+    def test_tracing_is_not_skipped_by_the_cache(self):
+        events = []
+        cache = enable_cache()
+        try:
+            repair_json("{ a: 1 }")
+            enable_tracing(lambda rule, position, seconds: events.append((rule, position)))
+            repair_json("{ a: 1 }")
+            repair_json("{ a: 1 }")
+            self.assertEqual(events, [('key_quoted', 2), ('key_quoted', 2)])
+            self.assertEqual(cache.hits, 0)
+        finally:
+            disable_tracing()
+            disable_cache()
+
+    def test_repair_edits_keep_the_layout(self):
+        input = "{\n  name: 'John'\n  'age': 30,\n  ref: <ref *1> { a: [Circular *1] },\n} trailing"
+        edits = repair_edits(input)
+        self.assertEqual([(edit.kind, edit.start, edit.end, edit.text) for edit in edits], [
+            ('replace', 4, 8, '"name"'),
+            ('replace', 10, 16, '"John"'),
+            ('insert', 16, 16, ','),
+            ('replace', 19, 24, '"age"'),
+            ('replace', 32, 35, '"ref"'),
+            ('replace', 35, 45, ':'),
+            ('replace', 48, 49, '"a"'),
+            ('replace', 52, 63, '"Circular"'),
+            ('delete', 66, 67, ''),
+            ('delete', 70, 78, ''),
+        ])
+        self.assertEqual(
+            apply_json_edits(input, edits),
+            '{\n  "name": "John",\n  "age": 30,\n  "ref": { "a": ["Circular"] }\n} '
+        )
+        self.assertEqual(repair_edits('{ "a": 1 }'), [])
+
+    def test_repair_edits_of_bytes_are_byte_offsets(self):
+        input = "{ é: 'é' }".encode('utf-8')
+        edits = repair_edits(input)
+        self.assertEqual([(edit.start, edit.end, edit.text) for edit in edits], [(2, 4, '"é"'), (6, 10, '"é"')])
+        output = io.BytesIO()
+        write_json_edits(memoryview(input), edits, output)
+        self.assertEqual(output.getvalue(), '{ "é": "é" }'.encode('utf-8'))
+
+    def test_top_level_arrays_and_primitives(self):
+        self.assertEqual(repair_json("[1, 'a', { b: True }, None,]"), '[1, "a", { "b": true }, null]')
+        self.assertEqual(repair_to_object(" [{ a: 1 } { b: 2 }]"), [{'a': 1}, {'b': 2}])
+        self.assertEqual(repair_json("'text'"), '"text"')
+        self.assertEqual(repair_json("True"), 'true')
+        # A valid JSON string stays a string, it is only unwrapped when it holds an object
+        for input, value in [('"123"', '123'), ('"true"', 'true'), ('"hello"', 'hello')]:
+            self.assertEqual(repair_json(input), input)
+            self.assertEqual(repair_to_object(input), value)
+        self.assertEqual(repair_json('"{ a: 1 }"'), '{ "a": 1 }')
+        with self.assertRaises(JsonFixError):
+            repair_json("2023-06-01 INFO started")
+        self.assertFalse(can_parse_json("[1, 2]"))
+
+    def test_iter_array_items(self):
+        input = "[\n  { id: 1, name: 'one' },\n  {\"id\": 2, \"tags\": [\"a\"]},\n  'three' + ' 3',\n  [Circular *1],\n]"
+        expected = ['{ "id": 1, "name": "one" }', '{ "id": 2, "tags": ["a"] }', '"three 3"', '["Circular"]']
+        self.assertEqual(list(iter_array_items(input)), expected)
+        self.assertEqual(list(iter_array_items(input.encode('utf-8'))), expected)
+        with self.assertRaises(JsonFixError):
+            list(iter_array_items("[1, 2"))
+        # Items too deep for json to decode are repaired instead
+        deep = '[' * 100000 + ']' * 100000
+        self.assertEqual(list(iter_array_items(deep)), ['[' * 99999 + ']' * 99999])
+        # NaN is not JSON, so it is not decoded as a valid item
+        for input in ['[NaN]', b'[1, Infinity]']:
+            with self.assertRaises(ValueError):
+                list(iter_array_items(input))
+
+    def test_repair_events(self):
+        class Recorder(JsonHandler):
+            def __init__(self):
+                self.events = []
+
+            def on_start_object(self):
+                self.events.append('{')
+
+            def on_end_object(self):
+                self.events.append('}')
+
+            def on_start_array(self):
+                self.events.append('[')
+
+            def on_end_array(self):
+                self.events.append(']')
+
+            def on_key(self, key):
+                self.events.append(('key', key))
+
+            def on_value(self, value):
+                self.events.append(value)
+
+        expected = ['{', ('key', 'a'), 1.5, ('key', 'b'), '[', True, None, 'x', ']', ('key', 'c'), '{', '}', '}']
+        broken = Recorder()
+        repair_events("{ a: 1.5, 'b': [True None 'x',], c: {} }", broken)
+        self.assertEqual(broken.events, expected)
+        valid = Recorder()
+        repair_events('{"a": 1.5, "b": [true, null, "x"], "c": {}}', valid)
+        self.assertEqual(valid.events, expected)
+
+    def test_expand_embedded_json(self):
+        source = {'a': "{ b: '{ c: [1,] }', d: ['{e:1}', 'no'] }", 'f': 'x { y }', 'g': True}
+        self.assertEqual(expand_embedded_json(source), {'a': {'b': {'c': [1]}, 'd': [{'e': 1}, 'no']}, 'f': 'x { y }', 'g': True})
+        self.assertEqual(expand_embedded_json(source, max_depth=1), {'a': {'b': '{ c: [1,] }', 'd': ['{e:1}', 'no']}, 'f': 'x { y }', 'g': True})
+        self.assertEqual(source['a'], "{ b: '{ c: [1,] }', d: ['{e:1}', 'no'] }")
+        self.assertEqual(expand_embedded_json("{ a: '{ b: 1 }', }"), {'a': {'b': 1}})
+
+    def test_log_jsons_to_a_stream(self):
+        output = io.StringIO()
+        log_jsons("""text { a: true, b: [1], c: "{ d: 1 }" }""", output)
+        self.assertEqual(output.getvalue(), 'text \n{\n  "a": true,\n  "b": [\n    1\n  ],\n  "c": "{ d: 1 }"\n}\n'
+                         '\nFOUND JSON found in key c --->\n\n{\n  "d": 1\n}\n\n\n')
+
+    def test_extract_paths(self):
+        paths = ['$.action', '$.action_input.query', '$.steps[1]', '$.missing']
+        expected = {'$.action': 'search', '$.action_input.query': 'weather in Paris', '$.steps[1]': {'n': 2}}
+        self.assertEqual(extract_paths("{ action: 'search', steps: [{n: 1}, {n: 2},], action_input: { query: 'weather in Paris' } }", paths), expected)
+        self.assertEqual(extract_paths('{"action": "search", "steps": [{"n": 1}, {"n": 2}], "action_input": {"query": "weather in Paris"}}', paths), expected)
+        # Once every path is found the rest of the text is not parsed, so it can be too broken to repair
+        self.assertEqual(extract_paths("{ action: 'search', action_input: { query: 'x' }, rest: [1, 2 }", paths[:2]), {'$.action': 'search', '$.action_input.query': 'x'})
+        with self.assertRaises(ValueError):
+            extract_paths('{}', ['action'])
+        # The first value of a key that appears twice is used, whether the JSON is broken or valid
+        for input in ['{ a: 1, a: 2, b: { c: 3, c: 4 }, b: { d: 5 } }', '{"a": 1, "a": 2, "b": {"c": 3, "c": 4}, "b": {"d": 5}}']:
+            self.assertEqual(extract_paths(input, ['$.a', '$.b', '$.b.d']), {'$.a': 1, '$.b': {'c': 3}})
+
+    def test_limits(self):
+        deep = '{ a: ' * 100 + '1' + ' }' * 100
+        with self.assertRaises(JsonDepthLimitError):
+            repair_json(deep, limits=JsonLimits(max_depth=50))
+        with self.assertRaises(JsonDepthLimitError):
+            repair_json(json.dumps(json.loads(repair_json(deep))), limits=JsonLimits(max_depth=50))
+        self.assertEqual(repair_json(deep, limits=JsonLimits(max_depth=100)), repair_json(deep))
+        with self.assertRaises(JsonInputLimitError):
+            repair_json(b'{ a: 1 }', limits=JsonLimits(max_input_length=7))
+        with self.assertRaises(JsonOutputLimitError):
+            repair_json('{ a: 1 }', limits=JsonLimits(max_output_length=9))
+        self.assertEqual(repair_json('{ a: 1 }', limits=JsonLimits(max_output_length=10)), '{ "a": 1 }')
+        # Text where every open brace fails to parse
+        braces = '\\{' * 200
+        for limits, error in [(JsonLimits(max_attempts=10), JsonAttemptLimitError), (JsonLimits(max_steps=10), JsonStepLimitError),
+                              (JsonLimits(max_seconds=0), JsonTimeLimitError)]:
+            with self.assertRaises(error):
+                to_array_of_plain_strings_or_json(braces, limits=limits)
+        # Limit errors are JsonFixErrors, and are not cached like other errors are
+        self.assertTrue(issubclass(JsonDepthLimitError, JsonLimitError) and issubclass(JsonLimitError, JsonFixError))
+        cache = enable_cache()
+        try:
+            for _ in range(2):
+                with self.assertRaises(JsonDepthLimitError):
+                    repair_json(deep, limits=JsonLimits(max_depth=50))
+            self.assertEqual(len(cache), 0)
+        finally:
+            disable_cache()
+
+    def test_calls_from_many_threads_at_once(self):
+        inputs = [
+            "{ name: 'John' 'age': 30, 'city': 'New' + ' York', }",
+            '{"valid": [1, 2, {"three": null}]}',
+            b"{ bytes: True, list: [1 2 3] }",
+            '"{\\"stringified\\": 1}"',
+            "text { a: 1 } more { b: [2,] } \\{ broken { c: 'x' + 'y' }",
+            "[1, { a: 2, }, 'three']",
+            '{ a: ' * 60 + '1' + ' }' * 60,
+        ]
+        calls = [
+            repair_json,
+            lambda text: json.dumps(repair_to_object(text)),
+            to_array_of_plain_strings_or_json,
+            last_json,
+            lambda text: repr(repair_edits(text)),
+            lambda text: extract_paths(text, ['$.a', '$.name']),
+            lambda text: repair_json(text, limits=JsonLimits(max_depth=50)),
+        ]
+
+        def run_all(order):
+            results = {}
+            for i in order:
+                call, text = divmod(i, len(inputs))
+                try:
+                    results[i] = calls[call](inputs[text])
+                except Exception as e:
+                    results[i] = type(e).__name__
+            return results
+
+        indexes = list(range(len(calls) * len(inputs)))
+        expected = run_all(indexes)
+        # Every thread makes every call, each in a different order, with the cache and
+        # tracing on, and with threads switching as often as they can
+        enable_cache(max_entries=8)
+        enable_tracing(lambda rule, position, seconds: None, sample_rate=0.5)
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            start = threading.Barrier(8)
+
+            def worker(seed):
+                order = indexes * 5
+                random.Random(seed).shuffle(order)
+                start.wait()
+                return run_all(order)
+
+            with concurrent.futures.ThreadPoolExecutor(8) as executor:
+                for results in executor.map(worker, range(8)):
+                    self.assertEqual(results, expected)
+        finally:
+            sys.setswitchinterval(switch_interval)
+            disable_tracing()
+            disable_cache()
+
 
 if __name__ == '__main__':
     unittest.main()